@@ -18,6 +18,7 @@ class Help(commands.Cog):
         app_commands.Choice(name="check", value="check"),
         app_commands.Choice(name="homework", value="homework"),
         app_commands.Choice(name="settings", value="settings"),
+        app_commands.Choice(name="schedule", value="schedule"),
         app_commands.Choice(name="mute", value="mute"),
         app_commands.Choice(name="unmute", value="unmute"),
         app_commands.Choice(name="invite", value="invite"),
@@ -55,6 +56,7 @@ class Help(commands.Cog):
         help_embed.add_field(
             name="⚙️ Configuration Commands",
             value="`/settings` - Configure your preferences\n"
+                  "`/schedule` - Choose when your daily reminder is sent\n"
                   "`/mute` - Mute daily notifications for a period of time\n"
                   "`/unmute` - Turn notifications back on\n",
             inline=False
@@ -129,14 +131,15 @@ class Help(commands.Cog):
             )
             embed.add_field(
                 name="Usage",
-                value="`/homework [days] [course_filter] [show_overdue]`",
+                value="`/homework [days] [course_filter] [show_overdue] [refresh]`",
                 inline=False
             )
             embed.add_field(
                 name="Parameters",
                 value="`days` - (Optional) Number of days to look ahead for assignments\n"
                       "`course_filter` - (Optional) Filter by course name\n"
-                      "`show_overdue` - (Optional) Whether to include overdue assignments",
+                      "`show_overdue` - (Optional) Whether to include overdue assignments\n"
+                      "`refresh` - (Optional) Reload your course list from Canvas",
                 inline=False
             )
             embed.add_field(
@@ -167,7 +170,32 @@ class Help(commands.Cog):
                 value="`dm` - Toggle homework reminders in your DMs\n"
                       "`ping` - Toggle sending homework info in the channel\n"
                       "`daily` - Toggle daily reminders\n"
-                      "`starred` - Toggle using only starred courses",
+                      "`starred` - Toggle using only starred courses\n"
+                      "`changes` - Toggle daily reminders that only list what changed",
+                inline=False
+            )
+            
+        elif command_name == "schedule":
+            embed = discord.Embed(
+                title="Command: /schedule",
+                description="Choose when your daily homework reminder is sent.",
+                color=discord.Color.blue()
+            )
+            embed.add_field(
+                name="Usage",
+                value="`/schedule time [timezone]`",
+                inline=False
+            )
+            embed.add_field(
+                name="Parameters",
+                value="`time` - Local time in 24-hour HH:MM format (e.g. 07:30)\n"
+                      "`timezone` - (Optional) Your timezone, such as America/New_York",
+                inline=False
+            )
+            embed.add_field(
+                name="Details",
+                value="Your daily reminder is sent at this time in your own timezone. "
+                      "By default reminders are sent at 5:00 AM Pacific time.",
                 inline=False
             )
             
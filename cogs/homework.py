@@ -1,13 +1,14 @@
 import discord
 from discord import app_commands
 from discord.ext import commands
-from aiohttp import ClientSession
 import asyncio
 import datetime
 import pytz
 
+from utils.config import HOMEWORK_BACKEND
 from utils.db_sqlite import db
-from utils.helpers import get_homework, get_token
+from utils.helpers import get_courses, get_homework, get_token
+from utils.outbox import INTERACTIVE
 
 class Homework(commands.Cog):
     """Commands for fetching and displaying homework information."""
@@ -19,7 +20,8 @@ class Homework(commands.Cog):
     @app_commands.describe(
         days="Number of days to look ahead for assignments",
         course_filter="Filter by course name (leave empty for all courses)",
-        show_overdue="Whether to include overdue assignments"
+        show_overdue="Whether to include overdue assignments",
+        refresh="Whether to reload your course list from Canvas"
     )
     @app_commands.choices(days=[
         app_commands.Choice(name="3 days", value=3),
@@ -30,7 +32,8 @@ class Homework(commands.Cog):
     async def homework(self, interaction: discord.Interaction, 
                        days: int = 7, 
                        course_filter: str = None,
-                       show_overdue: bool = True):
+                       show_overdue: bool = True,
+                       refresh: bool = False):
         """Get homework assignments from Canvas."""
         await interaction.response.defer(thinking=True)
         
@@ -45,32 +48,35 @@ class Homework(commands.Cog):
             endpoint = db[user_id]["endpoint"]
             headers = {"Authorization": f"Bearer {token}"}
             
-            # Get course list based on user settings
-            async with ClientSession() as session:
-                if db[user_id].get('starred', False):
-                    url = f"{endpoint}/users/self/favorites/courses"
-                else:
-                    url = f"{endpoint}/courses"
-                
-                async with session.get(
-                    url=url, 
-                    params={"enrollment_state": "active"}, 
-                    headers=headers
-                ) as response:
-                    if response.status != 200:
-                        await interaction.followup.send("There was an error fetching your courses. Please try again later.")
-                        return
-                    
-                    all_courses = await response.json()
-                    
-                    # Filter courses if a filter was provided
-                    if course_filter:
-                        course_list = [c for c in all_courses if course_filter.lower() in c.get('name', '').lower()]
-                        if not course_list:
-                            await interaction.followup.send(f"No courses found matching '{course_filter}'")
-                            return
-                    else:
-                        course_list = all_courses
+            starred = db[user_id].get('starred', False)
+            
+            # Answer from the local replica when it has been synced, unless the user asked for fresh data
+            replica = self.bot.replica if HOMEWORK_BACKEND == "replica" and not refresh else None
+            all_courses = await replica.courses(user_id, endpoint, starred) if replica is not None else None
+            
+            # Otherwise get the course list from Canvas based on user settings
+            if all_courses is None:
+                replica = None
+                all_courses = await get_courses(
+                    self.bot.canvas,
+                    endpoint,
+                    headers,
+                    starred=starred,
+                    user_id=user_id,
+                    refresh=refresh
+                )
+            if all_courses is None:
+                await interaction.followup.send("There was an error fetching your courses. Please try again later.")
+                return
+            
+            # Filter courses if a filter was provided
+            if course_filter:
+                course_list = [c for c in all_courses if course_filter.lower() in c.get('name', '').lower()]
+                if not course_list:
+                    await interaction.followup.send(f"No courses found matching '{course_filter}'")
+                    return
+            else:
+                course_list = all_courses
             
             await interaction.followup.send(f"Looking for assignments due in the next {days} days...")
             
@@ -81,30 +87,34 @@ class Homework(commands.Cog):
                 headers=headers, 
                 endpoint=endpoint, 
                 days_to_look_ahead=days, 
-                include_overdue=show_overdue
+                include_overdue=show_overdue,
+                client=self.bot.canvas,
+                replica=replica
             )
             
             due_soon_embed = homework_embeds[0]
             overdue_embed = homework_embeds[1]
             undated_embed = homework_embeds[2]
+            embeds = [overdue_embed, due_soon_embed, undated_embed]
             
             # Send embeds based on user settings
             if db[user_id].get("dm", True):
                 try:
                     dm_channel = await interaction.user.create_dm()
-                    await dm_channel.send(embed=overdue_embed)
-                    await dm_channel.send(embed=due_soon_embed)
-                    await dm_channel.send(embed=undated_embed)
+                    # Remember the DM channel so the daily reminder can skip looking it up
+                    if db[user_id].get("dm_channel_id") != str(dm_channel.id):
+                        db.set_dm_channel(user_id, dm_channel.id)
+                    await self.bot.outbox.send(dm_channel, embeds, priority=INTERACTIVE)
                 except discord.Forbidden:
-                    await interaction.followup.send("I couldn't send you a DM. Your homework will be displayed here instead.")
-                    await interaction.followup.send(embed=overdue_embed)
-                    await interaction.followup.send(embed=due_soon_embed)
-                    await interaction.followup.send(embed=undated_embed)
+                    await self.bot.outbox.send(
+                        interaction.followup,
+                        embeds,
+                        content="I couldn't send you a DM. Your homework will be displayed here instead.",
+                        priority=INTERACTIVE
+                    )
             
             if db[user_id].get("ping", False):
-                await interaction.followup.send(embed=overdue_embed)
-                await interaction.followup.send(embed=due_soon_embed)
-                await interaction.followup.send(embed=undated_embed)
+                await self.bot.outbox.send(interaction.followup, embeds, priority=INTERACTIVE)
             
             if not db[user_id].get("dm", True) and not db[user_id].get("ping", False):
                 await interaction.followup.send("Homework information sent to your DMs!")
@@ -5,7 +5,9 @@ from typing import Literal, Optional
 import datetime
 import pytz
 
-from utils.db_sqlite import db
+from utils.db_sqlite import adb, db
+from utils.helpers import invalidate_courses
+from utils.scheduler import next_delivery, parse_delivery_time
 
 class Settings(commands.Cog):
     """Commands for configuring bot settings."""
@@ -22,7 +24,8 @@ class Settings(commands.Cog):
         app_commands.Choice(name="DM Messages", value="dm"),
         app_commands.Choice(name="Channel Messages", value="ping"),
         app_commands.Choice(name="Daily Reminders", value="daily"),
-        app_commands.Choice(name="Starred Courses Only", value="starred")
+        app_commands.Choice(name="Starred Courses Only", value="starred"),
+        app_commands.Choice(name="Only Send Changes", value="changes")
     ])
     @app_commands.choices(state=[
         app_commands.Choice(name="On", value="on"),
@@ -92,20 +95,82 @@ class Settings(commands.Cog):
                     value=f"**Description:** Returns homework only on starred courses\n**Current Status:** {('Off', 'On')[user_settings.get('starred', False)]}"
                 )
             
+            if setting is None or setting == "changes":
+                embed.add_field(
+                    name="changes:",
+                    value=f"**Description:** Daily reminders only list what changed since the last one, and are skipped when nothing did\n**Current Status:** {('Off', 'On')[user_settings.get('changes', False)]}"
+                )
+            
+            if setting is None:
+                embed.add_field(
+                    name="schedule:",
+                    value=f"**Description:** When your daily reminder is sent (change it with /schedule)\n**Current Time:** {user_settings.get('delivery_time')} ({user_settings.get('timezone')})"
+                )
+            
             await interaction.response.send_message(embed=embed)
         
         # If state is provided, update the setting
         else:
-            if setting not in ["dm", "ping", "daily", "starred"]:
+            if setting not in ["dm", "ping", "daily", "starred", "changes"]:
                 await interaction.response.send_message("I'm sorry, that setting is not available.")
                 return
             
             new_state = state == "on"
-            user_settings[setting] = new_state
-            db[user_id] = user_settings
+            await adb.update_user(user_id, **{setting: new_state})
+            
+            # The cached course list depends on the starred setting
+            if setting == "starred":
+                invalidate_courses(user_id)
+            if setting == "daily":
+                self.bot.dispatch("schedule_changed", user_id)
             
             await interaction.response.send_message(f"{setting} configuration successfully set to {state}!")
     
+    @app_commands.command(name="schedule", description="Choose when your daily reminder is sent")
+    @app_commands.describe(
+        time="Local time to send your daily reminder, in 24-hour HH:MM format (e.g. 07:30)",
+        timezone="Your timezone (e.g. America/Los_Angeles, America/New_York, Europe/London)"
+    )
+    async def schedule(self, interaction: discord.Interaction, time: str, timezone: Optional[str] = None):
+        """Set the local time and timezone of the user's daily reminder."""
+        user_id = str(interaction.user.id)
+        
+        # Check if user has set up the bot
+        if user_id not in db:
+            await interaction.response.send_message(
+                "You have not set up the bot yet. Use the /setup command to begin this process."
+            )
+            return
+        
+        try:
+            delivery_time = parse_delivery_time(time).strftime("%H:%M")
+        except ValueError:
+            await interaction.response.send_message(
+                "Please provide a time in 24-hour HH:MM format, for example 07:30.",
+                ephemeral=True
+            )
+            return
+        
+        user_settings = db[user_id]
+        if timezone is None:
+            timezone = user_settings.get('timezone')
+        elif timezone not in pytz.all_timezones_set:
+            await interaction.response.send_message(
+                f"I don't recognize the timezone '{timezone}'. Please use a name like America/Los_Angeles.",
+                ephemeral=True
+            )
+            return
+        
+        # Update user settings and let the scheduler pick up the change
+        await adb.update_user(user_id, delivery_time=delivery_time, timezone=timezone)
+        self.bot.dispatch("schedule_changed", user_id)
+        
+        next_send = next_delivery(timezone, delivery_time, datetime.datetime.now(pytz.UTC))
+        next_send_display = next_send.astimezone(pytz.timezone(timezone)).strftime("%B %d, %Y at %I:%M %p %Z")
+        await interaction.response.send_message(
+            f"Your daily reminder will be sent at {delivery_time} ({timezone}). Next reminder: {next_send_display}."
+        )
+    
     @app_commands.command(name="mute", description="Mute daily notifications for a specified number of days")
     @app_commands.describe(days="Number of days to mute notifications (1-30)")
     async def mute(self, interaction: discord.Interaction, days: int):
@@ -136,9 +201,7 @@ class Settings(commands.Cog):
         mute_end_display = mute_end_time.strftime("%B %d, %Y at %I:%M %p %Z")
         
         # Update user settings
-        user_settings = db[user_id]
-        user_settings['muted_until'] = mute_end_iso
-        db[user_id] = user_settings
+        await adb.update_user(user_id, muted_until=mute_end_iso)
         
         # Create a response embed
         embed = discord.Embed(
@@ -176,8 +239,7 @@ class Settings(commands.Cog):
             return
         
         # Remove mute
-        user_settings.pop('muted_until', None)
-        db[user_id] = user_settings
+        await adb.update_user(user_id, muted_until=None)
         
         await interaction.response.send_message(
             "Daily notifications have been unmuted. You will now receive daily homework reminders again."
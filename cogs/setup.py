@@ -2,12 +2,12 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 import asyncio
-from aiohttp import ClientSession
 import os
 from pathlib import Path
 
 from utils.db_sqlite import db
 from utils.config import BASE_API
+from utils.helpers import invalidate_courses
 
 class Setup(commands.Cog):
     """Commands for setting up the Canvas bot."""
@@ -124,9 +124,9 @@ class Setup(commands.Cog):
                 # Validate the token
                 headers = {"Authorization": f"Bearer {token}"}
                 try:
-                    async with ClientSession() as session:
-                        async with session.get(url=f"{api_link}/accounts/search", params={"name": "Poway"}, headers=headers) as response:
-                            response.raise_for_status()
+                    response = await self.bot.canvas.get(f"{api_link}/accounts/search", headers=headers, params={"name": "Poway"})
+                    if not response.ok:
+                        raise ValueError(f"Canvas returned status {response.status}")
                     
                     # Save the user's token and settings
                     db[str(interaction.user.id)] = {
@@ -137,6 +137,8 @@ class Setup(commands.Cog):
                         "endpoint": api_link,
                         "starred": False
                     }
+                    invalidate_courses(interaction.user.id)
+                    self.bot.dispatch("schedule_changed", str(interaction.user.id))
                     
                     await dm_channel.send("Congratulations! You have successfully setup the bot! You will receive notifications at 5:00 PST by default about your homework due tomorrow!")
                     
@@ -4,120 +4,647 @@ from discord.ext import commands, tasks
 import datetime as dt
 import datetime
 import asyncio
+import time
+from collections import deque
 import pytz
-from aiohttp import ClientSession
 
-from utils.db_sqlite import db
-from utils.helpers import get_homework
+from utils.catalogue import AssignmentCatalogue
+from utils.config import (
+    CATALOGUE_TTL_MINUTES,
+    DAILY_ASSIGNMENT_WORKERS,
+    DAILY_COURSE_WORKERS,
+    DAILY_DELIVER_WORKERS,
+    DAILY_ELIGIBLE_WORKERS,
+    DAILY_MIN_RATE,
+    DAILY_QUEUE_SIZE,
+    DAILY_RATE_HEADROOM,
+    DAILY_RENDER_WORKERS,
+    DAILY_RESUME_HOURS,
+    DAILY_RETRY_BACKOFF_SECONDS,
+    DAILY_ROLE,
+    DELIVERY_WINDOW_MINUTES,
+    DEVELOPER_IDS,
+    HOMEWORK_BACKEND,
+    PREFETCH_LEAD_MINUTES,
+    REPLICA_SYNC_MINUTES,
+    SCHEDULE_SYNC_MINUTES,
+    SHARED_CATALOGUE,
+    WORKER_ID,
+)
+from utils.db_sqlite import DB_FILE, adb, db
+from utils.digests import Digest, DigestStore, dump_embeds, load_embeds
+from utils.helpers import fetch_homework, fetch_mode_for, get_courses, render_homework
+from utils.jobs import FETCHED, AsyncDailyJobStore, DailyJobStore
+from utils.leases import LeaseManager, SQLiteLeaseStore
+from utils.outbox import BATCH
+from utils.pipeline import Pacer, Pipeline, Stage
+from utils.replica import sync_user
+from utils.scheduler import DeliveryScheduler
+from utils.snapshots import AsyncSnapshotStore, SnapshotStore, diff_snapshots, render_changes, take_snapshot
+
+# Number of days ahead covered by the daily reminder
+DAILY_DAYS_TO_LOOK_AHEAD = 7
+
+# How often the daily run's target rate is recalculated, in seconds
+RATE_UPDATE_INTERVAL = 60
+
+# Period over which the observed delivery rate is measured, in seconds
+OBSERVED_RATE_PERIOD = 300
+
+# How long finished daily runs are kept in the job table, in days
+JOB_HISTORY_DAYS = 7
+
+# How often failed daily jobs are checked for a retry and stale runs are closed, in seconds
+JOB_MAINTENANCE_INTERVAL = 60
+
+# How long a background task waits before trying again after an error, in seconds
+TASK_RETRY_DELAY = 60
 
 class TasksCog(commands.Cog):
     """Handles scheduled tasks like daily homework reminders."""
     
     def __init__(self, bot):
         self.bot = bot
-        self.daily_homework_task.start()
+        self.scheduler = DeliveryScheduler()
+        self.prefetch_scheduler = DeliveryScheduler(lead_minutes=PREFETCH_LEAD_MINUTES)
+        self.runs = set()
+        
+        # Digests are built ahead of time and kept until their delivery slot
+        self.digests = DigestStore(max_age=(PREFETCH_LEAD_MINUTES + DELIVERY_WINDOW_MINUTES + 15) * 60)
+        
+        # Every run is recorded per user so a restart can pick up where it left off;
+        # its queries run on the database thread like the users table's
+        self.jobs = AsyncDailyJobStore(DailyJobStore(DB_FILE), db)
+        self.retrying = set()
+        
+        # What each user was last told about, for reminders that only list changes
+        self.snapshots = AsyncSnapshotStore(SnapshotStore(DB_FILE), db)
+        
+        # Course assignment definitions are fetched once and shared by every enrolled user
+        self.catalogue = AssignmentCatalogue(ttl=CATALOGUE_TTL_MINUTES * 60) if SHARED_CATALOGUE else None
+        
+        # Canvas fetches and Discord sends are paced to a target rate over the delivery window
+        self.canvas_pacer = Pacer(DAILY_MIN_RATE)
+        self.deliver_pacer = Pacer(DAILY_MIN_RATE)
+        self.rate_updated_at = None
+        
+        # Progress of the daily runs, for operators
+        self.in_flight = 0
+        self.progress = {"delivered": 0, "skipped": 0, "failed": 0}
+        self.recent_deliveries = deque(maxlen=10000)
+        
+        # With several processes sharing the daily run, each only handles the users in its leased partitions
+        self.headless = DAILY_ROLE == "worker"
+        self.leases = None
+        self.lease_task = None
+        if DAILY_ROLE != "standalone":
+            self.leases = LeaseManager(SQLiteLeaseStore(DB_FILE), WORKER_ID)
+        
+        # /homework reads from the local replica, which only this background sync refreshes from Canvas
+        self.replica_task = None
+        
+        self.scheduler_task = asyncio.create_task(self.daily_homework_task())
+        self.prefetch_task = asyncio.create_task(self.prefetch_homework_task())
+        self.job_task = asyncio.create_task(self.maintain_jobs())
+        if self.leases is not None:
+            self.lease_task = asyncio.create_task(self.maintain_leases())
+        if HOMEWORK_BACKEND == "replica":
+            self.replica_task = asyncio.create_task(self.sync_replica_task())
     
     def cog_unload(self):
         """Cancel tasks when the cog is unloaded."""
-        self.daily_homework_task.cancel()
+        self.scheduler_task.cancel()
+        self.prefetch_task.cancel()
+        self.job_task.cancel()
+        if self.replica_task is not None:
+            self.replica_task.cancel()
+        for run in self.runs:
+            run.cancel()
+        if self.leases is not None:
+            self.lease_task.cancel()
+            self.leases.release_all()
+            self.leases.store.close()
+        self.jobs.close()
+        self.snapshots.close()
+    
+    async def wait_until_ready(self):
+        """Wait for the gateway connection; headless workers only use the REST API and never connect."""
+        if not self.headless:
+            await self.bot.wait_until_ready()
+    
+    def owns(self, user_id):
+        """Whether this process handles a user's daily reminder."""
+        return self.leases is None or self.leases.owns(user_id)
+    
+    def start_run(self, coro):
+        """Run a slot in the background so a slow run never delays the next slot."""
+        run = asyncio.create_task(coro)
+        self.runs.add(run)
+        run.add_done_callback(self._run_done)
+    
+    def _run_done(self, run):
+        """Forget a finished run and log the error that ended it, if any."""
+        self.runs.discard(run)
+        if not run.cancelled() and run.exception() is not None:
+            error = run.exception()
+            self.bot.logger.error(f"Daily run failed: {error}", exc_info=(type(error), error, error.__traceback__))
     
-    @tasks.loop(hours=24)
     async def daily_homework_task(self):
-        """Send daily homework reminders to all users who have enabled them."""
-        # Get all users from the database
-        users = db.keys()
+        """Send daily homework reminders to each user at their chosen local time.
         
-        for user_id in users:
-            user_data = db[user_id]
-            
-            # Skip users who have disabled daily reminders
-            if not user_data.get('daily', True):
-                continue
-                
-            # Skip users who have muted notifications
-            if 'muted_until' in user_data:
-                try:
-                    # Parse the mute end time
-                    mute_end_time = datetime.datetime.fromisoformat(user_data['muted_until'])
-                    current_time = datetime.datetime.now(pytz.UTC)
-                    
-                    # If the mute hasn't expired yet, skip this user
-                    if current_time < mute_end_time:
-                        continue
-                    
-                    # If the mute has expired, remove it from the user data
-                    else:
-                        user_data.pop('muted_until', None)
-                        db[user_id] = user_data
-                except (ValueError, TypeError):
-                    # If there's an issue with the date format, proceed as if not muted
-                    pass
-            
+        Users are kept in a min-heap keyed by their next delivery time; each wake-up
+        only runs the users due in that slot.
+        """
+        await self.wait_until_ready()
+        
+        # An error here (e.g. a locked database) must not leave the bot without a schedule
+        while True:
             try:
-                # Get user's token and endpoint
-                token = user_data.get('id')
-                endpoint = user_data.get('endpoint')
-                headers = {"Authorization": f"Bearer {token}"}
-                
-                # Get course list based on user settings
-                async with ClientSession() as session:
-                    if user_data.get('starred', False):
-                        url = f"{endpoint}/users/self/favorites/courses"
-                    else:
-                        url = f"{endpoint}/courses"
-                    
-                    async with session.get(
-                        url=url, 
-                        params={"enrollment_state": "active"}, 
-                        headers=headers
-                    ) as response:
-                        if response.status != 200:
-                            continue
-                        
-                        course_list = await response.json()
-                
-                # Get homework assignments
-                homework_embeds = await get_homework(user_id, course_list, headers, endpoint)
-                due_soon_embed = homework_embeds[0]
-                overdue_embed = homework_embeds[1]
-                undated_embed = homework_embeds[2]
+                await self.load_schedule()
+                break
+            except Exception:
+                self.bot.logger.exception(f"Failed to load the daily reminder schedule, retrying in {TASK_RETRY_DELAY} seconds")
+                await asyncio.sleep(TASK_RETRY_DELAY)
+        
+        while True:
+            try:
+                user_ids = await self.scheduler.wait_due()
+                self.update_target_rate()
+                self.start_run(self.run_daily(user_ids))
+            except Exception:
+                self.bot.logger.exception("Error in the daily reminder scheduler")
+                await asyncio.sleep(TASK_RETRY_DELAY)
+    
+    async def load_schedule(self):
+        """Schedule every user with daily reminders on and resume the runs a restart interrupted."""
+        await adb.clear_expired_mutes()
+        async for chunk in adb.iter_users(daily_only=True):
+            for user_id, user_data in chunk:
+                self.reschedule(user_id, user_data)
+        self.bot.logger.info(f"Scheduled daily reminders for {len(self.scheduler)} users")
+        if self.leases is not None:
+            await db.run(self.leases.refresh)
+        await self.resume_unfinished()
+    
+    async def prefetch_homework_task(self):
+        """Build each user's digest PREFETCH_LEAD_MINUTES before their delivery time."""
+        await self.wait_until_ready()
+        
+        while True:
+            try:
+                user_ids = await self.prefetch_scheduler.wait_due()
+                self.update_target_rate()
+                self.digests.discard_stale()
+                if self.catalogue is not None:
+                    self.catalogue.discard_expired()
+                self.start_run(self.run_prefetch(user_ids))
+            except Exception:
+                self.bot.logger.exception("Error in the daily prefetch scheduler")
+                await asyncio.sleep(TASK_RETRY_DELAY)
+    
+    async def maintain_leases(self):
+        """Keep this process's partition leases renewed and its schedule in sync with the database.
+        
+        Settings changed through another process never reach this one as an
+        event, so the schedule is reloaded every SCHEDULE_SYNC_MINUTES.
+        """
+        await self.wait_until_ready()
+        synced_at = time.monotonic()
+        
+        while True:
+            await asyncio.sleep(self.leases.ttl / 3)
+            try:
+                owned = len(self.leases.owned)
+                # The lease queries run on the database thread like every other query
+                await db.run(self.leases.refresh)
+                if len(self.leases.owned) != owned:
+                    self.bot.logger.info(f"Worker {self.leases.worker_id} now holds {len(self.leases.owned)} partitions")
                 
-                # Send DMs to the user
-                try:
-                    discord_user = await self.bot.fetch_user(int(user_id))
-                    await discord_user.send(embed=overdue_embed)
-                    await discord_user.send(embed=due_soon_embed)
-                    await discord_user.send(embed=undated_embed)
-                except (discord.NotFound, discord.Forbidden):
-                    # User not found or DMs are blocked
-                    continue
+                if time.monotonic() - synced_at >= SCHEDULE_SYNC_MINUTES * 60:
+                    synced_at = time.monotonic()
+                    await self.sync_schedule()
+            except Exception:
+                self.bot.logger.exception("Failed to maintain partition leases")
+    
+    async def sync_schedule(self):
+        """Reschedule users whose settings changed and drop users who were removed."""
+        user_ids = set()
+        async for chunk in adb.iter_users():
+            for user_id, user_data in chunk:
+                user_ids.add(user_id)
+                self.reschedule(user_id, user_data)
+        for scheduler in (self.scheduler, self.prefetch_scheduler):
+            for user_id in [user_id for user_id in scheduler.user_ids() if user_id not in user_ids]:
+                scheduler.remove(user_id)
+    
+    async def sync_replica_task(self):
+        """Keep the homework replica of this process's users synced from Canvas.
+        
+        Every pass syncs the users whose replica is older than REPLICA_SYNC_MINUTES,
+        paced so the pass is spread over that period instead of bursting.
+        """
+        await self.wait_until_ready()
+        period = REPLICA_SYNC_MINUTES * 60
+        
+        while True:
+            started = time.monotonic()
+            try:
+                await self.sync_replica(period)
+            except Exception:
+                self.bot.logger.exception("Failed to sync the homework replica")
             
-            except Exception as e:
-                # Log the error but continue with other users
-                print(f"Error sending daily homework reminder to user {user_id}: {e}")
-                continue
+            await asyncio.sleep(max(period - (time.monotonic() - started), 60))
+    
+    async def sync_replica(self, period):
+        """Sync the replicas older than ``period`` seconds and drop those of removed users."""
+        user_ids = []
+        async for chunk in adb.iter_users():
+            user_ids.extend(user_id for user_id, _ in chunk)
+        stale = [user_id for user_id in await self.bot.replica.stale_users(user_ids, time.time() - period) if self.owns(user_id)]
+        
+        if stale:
+            pipeline = Pipeline("Replica sync", [
+                Stage("sync", self._sync_replica, DAILY_COURSE_WORKERS, DAILY_QUEUE_SIZE, Pacer(max(len(stale) / period, DAILY_MIN_RATE))),
+            ], describe=lambda user_id: f"user {user_id}")
+            synced = await pipeline.run(stale)
+            self.bot.logger.info(f"Synced the homework replica of {synced}/{len(stale)} users")
+        await self.bot.replica.prune(user_ids)
+    
+    async def _sync_replica(self, user_id):
+        """Sync one user's homework replica, dropping users who were removed."""
+        user_data = await adb.get(user_id)
+        if user_data is None:
+            return None
+        if not await sync_user(self.bot.replica, self.bot.canvas, user_id, user_data, self.catalogue):
+            return None
+        return user_id
     
-    @daily_homework_task.before_loop
-    async def before_daily_homework_task(self):
-        """Wait until the specified time before starting the daily homework task."""
-        await self.bot.wait_until_ready()
+    async def maintain_jobs(self):
+        """Retry failed daily jobs with backoff and close runs too old to resume.
         
-        # Set the time to run the task (5:00 AM PST)
-        hour = 5
-        minute = 0
+        A job that failed ``attempts`` times is retried DAILY_RETRY_BACKOFF_SECONDS
+        * 2 ** (attempts - 1) after its last failure, until it reaches
+        DAILY_MAX_ATTEMPTS. Jobs whose delivery time hasn't come yet are left to
+        the scheduler.
+        """
+        await self.wait_until_ready()
         
-        now = dt.datetime.now()
-        future = dt.datetime(now.year, now.month, now.day, hour, minute)
+        while True:
+            await asyncio.sleep(JOB_MAINTENANCE_INTERVAL)
+            try:
+                await self.retry_failed_jobs()
+            except Exception:
+                self.bot.logger.exception("Failed to check the daily job table")
+    
+    async def retry_failed_jobs(self):
+        """Close stale runs and start a retry for the failed jobs whose backoff has passed."""
+        now = time.time()
+        since = now - DAILY_RESUME_HOURS * 3600
+        await self.jobs.finish_runs(before=since)
+        await self.jobs.prune(before=now - JOB_HISTORY_DAYS * 86400)
+        
+        due = [
+            user_id for slot, user_id, attempts, updated_at in await self.jobs.retryable(since)
+            if slot <= now and updated_at + DAILY_RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1) <= now
+            and user_id not in self.retrying and self.owns(user_id)
+        ]
+        if due:
+            due = list(dict.fromkeys(due))
+            self.bot.logger.info(f"Retrying failed daily reminders for {len(due)} users")
+            self.start_run(self.retry_daily(due))
+    
+    async def retry_daily(self, user_ids):
+        """Run the daily delivery again for users whose job failed."""
+        self.retrying.update(user_ids)
+        try:
+            return await self.run_daily(user_ids)
+        finally:
+            self.retrying.difference_update(user_ids)
+    
+    async def resume_unfinished(self):
+        """Finish the daily runs that were interrupted by a restart.
         
-        # If it's already past the scheduled time, schedule for tomorrow
-        if now.hour >= hour and now.minute > minute:
-            future += dt.timedelta(days=1)
+        Users whose delivery time has already passed are delivered now; the rest
+        are picked up by the scheduler at their usual time. Delivered users are
+        never sent their digest twice.
+        """
+        now = time.time()
+        await self.jobs.finish_runs(before=now - DAILY_RESUME_HOURS * 3600)
+        await self.jobs.prune(before=now - JOB_HISTORY_DAYS * 86400)
+        overdue = [
+            user_id for slot, user_id in await self.jobs.unfinished(now - DAILY_RESUME_HOURS * 3600)
+            if slot <= now and self.owns(user_id)
+        ]
+        if overdue:
+            self.bot.logger.info(f"Resuming interrupted daily runs for {len(overdue)} users")
+            self.start_run(self.run_daily(list(dict.fromkeys(overdue))))
+    
+    def update_target_rate(self, force=False):
+        """Pace the daily run so the users of the coming window are spread across it."""
+        now = datetime.datetime.now(pytz.UTC)
+        if not force and self.rate_updated_at and (now - self.rate_updated_at).total_seconds() < RATE_UPDATE_INTERVAL:
+            return
+        self.rate_updated_at = now
         
-        # Calculate seconds until the scheduled time
-        seconds_until_scheduled_time = (future - now).total_seconds()
+        window = datetime.timedelta(minutes=max(DELIVERY_WINDOW_MINUTES, 1))
+        upcoming = self.upcoming_users(now + window) + self.in_flight
+        rate = max(DAILY_MIN_RATE, DAILY_RATE_HEADROOM * upcoming / window.total_seconds())
+        self.canvas_pacer.rate = rate
+        self.deliver_pacer.rate = rate
+    
+    def upcoming_users(self, when):
+        """Count the users this process delivers to at or before a UTC datetime."""
+        return self.scheduler.count_due_before(when, None if self.leases is None else self.owns)
+    
+    def reschedule(self, user_id, user_data):
+        """Schedule a user's next daily reminder from their current settings."""
+        if not user_data or not user_data.get('daily', True):
+            self.scheduler.remove(user_id)
+            self.prefetch_scheduler.remove(user_id)
+            return
+        settings = (user_data.get('timezone'), user_data.get('delivery_time'))
+        if self.scheduler.settings(user_id) == settings and user_id in self.prefetch_scheduler:
+            return
+        self.scheduler.schedule(user_id, user_data.get('timezone'), user_data.get('delivery_time'))
+        self.prefetch_scheduler.schedule(user_id, user_data.get('timezone'), user_data.get('delivery_time'))
+    
+    @commands.Cog.listener()
+    async def on_schedule_changed(self, user_id):
+        """Pick up a user's changed reminder settings without a restart."""
+        self.reschedule(user_id, await adb.get(user_id))
+    
+    async def run_prefetch(self, user_ids):
+        """Fetch and render the digests of users whose delivery time is coming up.
+        
+        Users stream through the stages eligible users -> course list -> assignments
+        -> render -> store. Each stage has its own workers and bounded queue, so a
+        slow Canvas host only backs up its own stage.
+        """
+        await adb.clear_expired_mutes()
+        eligible = await adb.eligible_users(user_id for user_id in user_ids if self.owns(user_id))
+        user_ids = list(eligible)
+        if not user_ids:
+            return 0
+        
+        slot = time.time() + PREFETCH_LEAD_MINUTES * 60
+        run_id = await self.jobs.create_run(slot, user_ids)
+        
+        pipeline = Pipeline("Daily homework prefetch", [
+            Stage("eligible users", self._load_user, DAILY_ELIGIBLE_WORKERS, DAILY_QUEUE_SIZE),
+            Stage("course list", self._fetch_courses, DAILY_COURSE_WORKERS, DAILY_QUEUE_SIZE, self.canvas_pacer),
+            Stage("assignments", self._fetch_assignments, DAILY_ASSIGNMENT_WORKERS, DAILY_QUEUE_SIZE),
+            Stage("render", self._render, DAILY_RENDER_WORKERS, DAILY_QUEUE_SIZE),
+            Stage("store", self._store_digest, 1, DAILY_QUEUE_SIZE),
+        ], describe=lambda job: f"user {job['user_id']}", on_failed=self._job_failed)
+        jobs = ({"run_id": run_id, "user_id": user_id, "user_data": eligible[user_id]} for user_id in user_ids)
+        stored = await pipeline.run(jobs)
+        self.log_summary(pipeline, user_ids)
+        return stored
+    
+    async def run_daily(self, user_ids):
+        """Deliver the daily homework digests of the given users.
+        
+        Users stream through the stages eligible users -> digest -> deliver. The
+        digest comes from the prefetch store, or from a live fetch if the prefetch
+        for that user failed, so slow Canvas work stays out of the delivery path.
+        Each user's job is looked up first; users without an open job (already
+        delivered, or given up after DAILY_MAX_ATTEMPTS) are not sent anything.
+        """
+        user_ids = [user_id for user_id in user_ids if self.owns(user_id)]
+        since = time.time() - DAILY_RESUME_HOURS * 3600
+        jobs, missing = await self.jobs.lookup(user_ids, since)
+        
+        # Users whose prefetch never ran (e.g. the bot started in between) get a new run
+        if missing:
+            run_id = await self.jobs.create_run(time.time(), missing)
+            jobs.extend({"run_id": run_id, "user_id": user_id} for user_id in missing)
+        
+        # Load every user's settings in one query; users with reminders off or muted are skipped
+        await adb.clear_expired_mutes()
+        eligible = await adb.eligible_users(job["user_id"] for job in jobs)
+        for job in jobs:
+            job["user_data"] = eligible.get(job["user_id"])
+        
+        pipeline = Pipeline("Daily homework", [
+            Stage("eligible users", self._load_user, DAILY_ELIGIBLE_WORKERS, DAILY_QUEUE_SIZE),
+            Stage("digest", self._prepare_digest, DAILY_ASSIGNMENT_WORKERS, DAILY_QUEUE_SIZE),
+            Stage("deliver", self._deliver, DAILY_DELIVER_WORKERS, DAILY_QUEUE_SIZE, self.deliver_pacer),
+        ], describe=lambda job: f"user {job['user_id']}", on_failed=self._job_failed, on_dropped=self._job_skipped)
+        
+        self.in_flight += len(jobs)
+        try:
+            delivered = await pipeline.run(jobs)
+        finally:
+            self.in_flight -= len(jobs)
+            await self.jobs.finish_runs()
+        
+        self.progress["delivered"] += delivered
+        self.progress["skipped"] += sum(stage.stats.dropped for stage in pipeline.stages)
+        self.progress["failed"] += sum(stage.stats.failed for stage in pipeline.stages)
+        self.log_summary(pipeline, user_ids)
+        return delivered
+    
+    def log_summary(self, pipeline, user_ids):
+        """Log a run's per-stage summary."""
+        # Jittered slots usually hold a single user, so only summarize larger runs at info level
+        if len(user_ids) > 1:
+            self.bot.logger.info(pipeline.summary())
+        else:
+            self.bot.logger.debug(pipeline.summary())
+    
+    async def _load_user(self, job):
+        """Prepare a user's Canvas credentials, dropping users with daily reminders off or muted."""
+        user_data = job["user_data"]
+        if not user_data:
+            return None
+        
+        # Get user's token and endpoint
+        job["endpoint"] = user_data.get('endpoint')
+        job["headers"] = {"Authorization": f"Bearer {user_data.get('id')}"}
+        return job
+    
+    async def _fetch_courses(self, job):
+        """Fetch the user's course list based on their settings."""
+        job["course_list"] = await get_courses(
+            self.bot.canvas,
+            job["endpoint"],
+            job["headers"],
+            starred=job["user_data"].get('starred', False),
+            user_id=job["user_id"]
+        )
+        if job["course_list"] is None:
+            return None
+        return job
+    
+    async def _fetch_assignments(self, job):
+        """Fetch the user's homework assignments.
+        
+        Users who only want changes are compared against their last snapshot, so
+        they get every pending assignment rather than the windowed view of the
+        catalogue and planner, which would make assignments appear and vanish as
+        the window moves.
+        """
+        job["now"] = datetime.datetime.now(pytz.UTC)
+        if job["user_data"].get('changes', False):
+            mode = "single" if fetch_mode_for(job["endpoint"]) == "planner" else None
+            job["course_homework"] = await fetch_homework(
+                self.bot.canvas,
+                job["course_list"],
+                job["headers"],
+                job["endpoint"],
+                mode=mode,
+                now=job["now"],
+                complete=True
+            )
+            return job
+        
+        job["course_homework"] = await fetch_homework(
+            self.bot.canvas,
+            job["course_list"],
+            job["headers"],
+            job["endpoint"],
+            now=job["now"],
+            cutoff_date=job["now"] + datetime.timedelta(days=DAILY_DAYS_TO_LOOK_AHEAD),
+            catalogue=self.catalogue
+        )
+        return job
+    
+    async def _render(self, job):
+        """Render the user's homework embeds in the order they are sent.
+        
+        Users who only want changes get one embed listing what changed since
+        their last snapshot, or none at all on a quiet day. Their first reminder
+        is a full one.
+        """
+        if job["user_data"].get('changes', False):
+            previous = await self.snapshots.load(job["user_id"])
+            job["snapshot"] = take_snapshot(job["course_homework"], previous)
+            if previous is not None:
+                changes_embed = render_changes(diff_snapshots(previous, job["snapshot"]))
+                job["embeds"] = [changes_embed] if changes_embed else []
+                return job
+        
+        due_soon_embed, overdue_embed, undated_embed = render_homework(job["course_homework"], DAILY_DAYS_TO_LOOK_AHEAD, True, job["now"])
+        job["embeds"] = [overdue_embed, due_soon_embed, undated_embed]
+        return job
+    
+    async def _store_digest(self, job):
+        """Keep the rendered digest until the user's delivery time."""
+        digest = Digest(job["user_id"], job["embeds"], snapshot=job.get("snapshot"))
+        self.digests.put(digest)
+        await self.jobs.mark_fetched(job["run_id"], job["user_id"], dump_embeds(digest.embeds), digest.content_hash)
+        return job
+    
+    async def _prepare_digest(self, job):
+        """Use the user's prefetched digest, falling back to a live fetch if there is none."""
+        digest = self.digests.take(job["user_id"])
+        if digest is not None:
+            job["embeds"] = digest.embeds
+            job["snapshot"] = digest.snapshot
+            return job
+        
+        # After a restart the digest is only in the job table
+        if job.get("status") == FETCHED and time.time() - job["fetched_at"] <= self.digests.max_age:
+            job["embeds"] = load_embeds(job["digest"])
+            return job
+        
+        if await self._fetch_courses(job) is None:
+            raise RuntimeError("Canvas did not return the course list")
+        await self._fetch_assignments(job)
+        return await self._render(job)
+    
+    async def _save_snapshot(self, job):
+        """Remember what the user has now been told about.
+        
+        Digests restored from the job table carry no snapshot; their changes are
+        simply reported again next time.
+        """
+        if job.get("snapshot") is not None:
+            await self.snapshots.save(job["user_id"], job["snapshot"])
+    
+    async def _job_failed(self, stage, job, error):
+        """Count a failed attempt at a user's job."""
+        await self.jobs.mark_failed(job["run_id"], job["user_id"], error)
+    
+    async def _job_skipped(self, stage, job):
+        """Close the job of a user who was not sent a reminder."""
+        await self.jobs.mark_skipped(job["run_id"], job["user_id"])
+    
+    async def _deliver(self, job):
+        """Send the homework embeds to the user's DMs."""
+        # Nothing changed for a user who only wants changes
+        if not job["embeds"]:
+            await self._save_snapshot(job)
+            return None
+        
+        # Send straight to the stored DM channel; resolve it again only if that fails
+        channel_id = job["user_data"].get('dm_channel_id')
+        if channel_id:
+            channel = self.bot.get_partial_messageable(int(channel_id), type=discord.ChannelType.private)
+            try:
+                await self.bot.outbox.send(channel, job["embeds"], priority=BATCH)
+            except (discord.NotFound, discord.Forbidden):
+                channel_id = None
+        
+        if not channel_id:
+            try:
+                discord_user = await self.bot.fetch_user(int(job["user_id"]))
+                channel = await discord_user.create_dm()
+                await adb.set_dm_channel(job["user_id"], channel.id)
+                await self.bot.outbox.send(channel, job["embeds"], priority=BATCH)
+            except (discord.NotFound, discord.Forbidden):
+                # User not found or DMs are blocked
+                return None
+        await self._save_snapshot(job)
+        await self.jobs.mark_delivered(job["run_id"], job["user_id"])
+        self.recent_deliveries.append(time.monotonic())
+        return job
+    
+    @app_commands.command(name="backlog", description="Show the progress of daily reminder delivery (developers only)")
+    async def backlog(self, interaction: discord.Interaction):
+        """Show daily run progress and the remaining backlog so operators can tune the delivery window."""
+        if str(interaction.user.id) not in DEVELOPER_IDS:
+            await interaction.response.send_message("This command is only available to the bot developers.", ephemeral=True)
+            return
+        
+        self.update_target_rate(force=True)
+        now = datetime.datetime.now(pytz.UTC)
+        window = datetime.timedelta(minutes=DELIVERY_WINDOW_MINUTES)
+        upcoming = self.upcoming_users(now + window)
+        rate = self.deliver_pacer.rate or DAILY_MIN_RATE
+        
+        # Time needed to clear what is queued or due in the next window at the rate actually achieved
+        cutoff = time.monotonic() - OBSERVED_RATE_PERIOD
+        recent = sum(1 for delivered_at in self.recent_deliveries if delivered_at >= cutoff)
+        observed_rate = recent / OBSERVED_RATE_PERIOD
+        backlog = upcoming + self.in_flight
+        clear_minutes = backlog / (observed_rate or rate) / 60
+        
+        embed = discord.Embed(title="Daily Reminder Backlog", color=discord.Color.blue())
+        embed.add_field(name="Scheduled Users", value=str(len(self.scheduler)))
+        embed.add_field(name="In Progress", value=str(self.in_flight))
+        embed.add_field(name=f"Due in the Next {DELIVERY_WINDOW_MINUTES} Minutes", value=str(upcoming))
+        embed.add_field(
+            name="Since Startup",
+            value=f"{self.progress['delivered']} delivered, {self.progress['skipped']} skipped, {self.progress['failed']} failed"
+        )
+        embed.add_field(name="Target Rate", value=f"{rate:.2f} users/s")
+        embed.add_field(name="Observed Rate", value=f"{observed_rate:.2f} users/s (last {OBSERVED_RATE_PERIOD // 60} minutes)")
+        embed.add_field(name="Time to Clear Backlog", value=f"{clear_minutes:.1f} minutes")
+        cache = db.row_cache_stats()
+        embed.add_field(
+            name="User Row Cache",
+            value=f"{cache['size']} rows, {cache['hits']} hits, {cache['misses']} misses ({cache['hit_rate']:.0%} hit rate)"
+        )
+        
+        if clear_minutes > DELIVERY_WINDOW_MINUTES:
+            embed.add_field(
+                name="Warning",
+                value="The backlog takes longer to clear than the delivery window. Consider widening DELIVERY_WINDOW_MINUTES.",
+                inline=False
+            )
         
-        # Wait until the scheduled time
-        await asyncio.sleep(seconds_until_scheduled_time)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
     
     @app_commands.command(name="invite", description="Get the invite link for the bot")
     @app_commands.describe(
@@ -8,7 +8,11 @@ import logging
 from pathlib import Path
 
 from keep_alive import keep_alive
-from utils.db_sqlite import db
+from utils.db_sqlite import adb, db, DB_FILE
+from utils.canvas import CanvasClient
+from utils.outbox import Outbox
+from utils.replica import AsyncReplicaStore, ReplicaStore
+from utils.config import HOMEWORK_BACKEND, HTTP_CACHE_PERSIST
 
 # Configure logging
 logging.basicConfig(
@@ -40,6 +44,12 @@ class CanvasBot(commands.Bot):
         )
         self.synced = False
         self.logger = logger
+        # Shared Canvas HTTP client, reused by every cog for the bot's lifetime
+        self.canvas = CanvasClient(cache_file=DB_FILE if HTTP_CACHE_PERSIST else None)
+        # Every outgoing message goes through one queue that packs embeds and orders sends
+        self.outbox = Outbox()
+        # Local copy of Canvas homework, kept up to date by the tasks cog when /homework reads from it
+        self.replica = AsyncReplicaStore(ReplicaStore(DB_FILE), db) if HOMEWORK_BACKEND == "replica" else None
     
     async def setup_hook(self):
         """Load cogs and sync app commands."""
@@ -102,6 +112,18 @@ class CanvasBot(commands.Bot):
             import traceback
             logger.error(traceback.format_exc())
     
+    async def close(self):
+        """Release shared resources once the cogs and their tasks are shut down."""
+        # Unloading the cogs cancels their tasks; closing Canvas first would let them open a new session
+        await super().close()
+        await self.canvas.close()
+        # The replica sync runs in the tasks cog, so the replica is only closed once it has stopped,
+        # and on the database thread behind any query it left queued there
+        if self.replica is not None:
+            await db.run(self.replica.close)
+        # Write the buffered database changes, including any made by the tasks as they stopped
+        await adb.flush()
+    
     async def on_ready(self):
         """Event triggered when the bot is ready."""
         logger.info(f"Logged in as {self.user} (ID: {self.user.id})")
@@ -0,0 +1,183 @@
+"""In-memory caches shared by the bot."""
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger('canvasbot.cache')
+
+
+class TTLCache:
+    """A bounded mapping whose entries expire after a fixed time to live.
+
+    When full, the least recently used entry is evicted.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """Return a live entry and mark it as recently used, or the default."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return default
+
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        """Store an entry, evicting the least recently used one if the cache is full."""
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """Remove an entry and return its value."""
+        entry = self._entries.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        """Remove every entry."""
+        self._entries.clear()
+
+
+class CachedResponse:
+    """A cached Canvas response body with the validators needed to revalidate it."""
+
+    __slots__ = ("etag", "last_modified", "data", "links", "size")
+
+    def __init__(self, etag, last_modified, data, links, size):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.data = data
+        self.links = links
+        self.size = size
+
+    def conditional_headers(self):
+        """Return the headers that make a request conditional on this response."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """An LRU cache of Canvas responses keyed by (token, URL, params), bounded by entries and bytes.
+
+    Tokens are only stored as a hash. When a database file is given, the
+    cache is loaded from and saved to its http_cache table.
+    """
+
+    def __init__(self, maxsize, max_bytes, db_file=None):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.db_file = db_file
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        if db_file is not None:
+            self.load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key(token, url, params=None):
+        """Build the cache key for a request."""
+        token_hash = hashlib.sha256(token.encode()).hexdigest()[:32]
+        query = "&".join(f"{name}={value}" for name, value in sorted((params or {}).items()))
+        return f"{token_hash} {url}?{query}"
+
+    def get(self, key):
+        """Return a cached response and mark it as recently used."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key, entry):
+        """Store a response, evicting the least recently used ones to stay within bounds."""
+        if entry.size > self.max_bytes:
+            return
+        self.pop(key)
+        self._entries[key] = entry
+        self.total_bytes += entry.size
+        while len(self._entries) > self.maxsize or self.total_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.total_bytes -= evicted.size
+
+    def pop(self, key):
+        """Remove a cached response."""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry.size
+        return entry
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_file)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS http_cache (
+                key TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                body TEXT,
+                links TEXT,
+                stored_at REAL
+            )
+        ''')
+        return conn
+
+    def load(self):
+        """Load the most recently stored responses from the database."""
+        try:
+            conn = self._connect()
+            try:
+                rows = conn.execute(
+                    "SELECT key, etag, last_modified, body, links FROM http_cache ORDER BY stored_at DESC LIMIT ?",
+                    (self.maxsize,)
+                ).fetchall()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.error(f"Failed to load the HTTP cache: {e}")
+            return
+
+        # Insert oldest first so the newest end up most recently used
+        for key, etag, last_modified, body, links in reversed(rows):
+            self.set(key, CachedResponse(etag, last_modified, json.loads(body), json.loads(links), len(body)))
+
+    def save(self):
+        """Replace the stored responses with the current contents of the cache."""
+        if self.db_file is None:
+            return
+        try:
+            conn = self._connect()
+            try:
+                now = time.time()
+                with conn:
+                    conn.execute("DELETE FROM http_cache")
+                    conn.executemany(
+                        "INSERT INTO http_cache (key, etag, last_modified, body, links, stored_at) VALUES (?, ?, ?, ?, ?, ?)",
+                        [
+                            (key, entry.etag, entry.last_modified, json.dumps(entry.data), json.dumps(entry.links), now + index * 1e-6)
+                            for index, (key, entry) in enumerate(self._entries.items())
+                        ]
+                    )
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.error(f"Failed to save the HTTP cache: {e}")
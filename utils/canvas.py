@@ -0,0 +1,259 @@
+"""Shared HTTP client for talking to the Canvas API."""
+import asyncio
+import logging
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from utils.config import (
+    CANVAS_CONNECTION_LIMIT,
+    CANVAS_CONNECTION_LIMIT_PER_HOST,
+    CANVAS_DNS_CACHE_TTL,
+    CANVAS_KEEPALIVE_TIMEOUT,
+    CANVAS_MAX_CONCURRENCY_PER_HOST,
+    CANVAS_MAX_CONCURRENCY_PER_TOKEN,
+    CANVAS_PAGE_SIZE,
+    CANVAS_RATE_LIMIT_RETRIES,
+    CANVAS_REQUEST_TIMEOUT,
+    HTTP_CACHE_MAX_BYTES,
+    HTTP_CACHE_SIZE,
+)
+from utils.cache import CachedResponse, ResponseCache
+from utils.ratelimit import CanvasRateLimiter
+
+logger = logging.getLogger('canvasbot.canvas')
+
+# Only advertise brotli when we can actually decode it
+try:
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    ACCEPT_ENCODING = "gzip, deflate"
+
+
+class CanvasError(Exception):
+    """Raised when Canvas returns an error while streaming a paginated listing."""
+
+    def __init__(self, status, url):
+        super().__init__(f"Canvas returned {status} for {url}")
+        self.status = status
+        self.url = url
+
+
+class CanvasRateLimited(Exception):
+    """Raised when Canvas keeps throttling a token after every retry."""
+
+    def __init__(self, url):
+        super().__init__("Canvas is rate limiting requests for this account. Please try again in a minute.")
+        self.url = url
+
+
+class CanvasResponse:
+    """The parsed result of a single Canvas API request."""
+
+    __slots__ = ("status", "data", "headers", "links")
+
+    def __init__(self, status, data=None, headers=None, links=None):
+        self.status = status
+        self.data = data
+        self.headers = headers or {}
+        self.links = links or {}
+
+    @property
+    def ok(self):
+        """Whether the request succeeded."""
+        return self.status == 200
+
+
+class CanvasClient:
+    """A pooled, keep-alive HTTP client shared by every cog for the bot's lifetime.
+
+    The underlying aiohttp session is created lazily on first use so the client
+    can be constructed outside of a running event loop. Requests are bounded by
+    a concurrency limit per Canvas token and per host, paced by each token's
+    remaining rate-limit budget, and retried with backoff when throttled.
+    GET responses carrying an ETag or Last-Modified header are cached and
+    revalidated with conditional requests; pass a SQLite ``cache_file`` to keep
+    the cache across restarts.
+    """
+
+    def __init__(self, max_per_token=CANVAS_MAX_CONCURRENCY_PER_TOKEN, max_per_host=CANVAS_MAX_CONCURRENCY_PER_HOST, cache_file=None):
+        self._session = None
+        self.max_per_token = max_per_token
+        self.max_per_host = max_per_host
+        self._token_limits = {}
+        self._host_limits = {}
+        self.rate_limiter = CanvasRateLimiter()
+        self.response_cache = ResponseCache(HTTP_CACHE_SIZE, HTTP_CACHE_MAX_BYTES, cache_file)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    @property
+    def closed(self):
+        """Whether the client has been closed (or never opened)."""
+        return self._session is None or self._session.closed
+
+    def _get_session(self):
+        """Return the shared session, creating it on first use."""
+        if self.closed:
+            connector = aiohttp.TCPConnector(
+                limit=CANVAS_CONNECTION_LIMIT,
+                limit_per_host=CANVAS_CONNECTION_LIMIT_PER_HOST,
+                ttl_dns_cache=CANVAS_DNS_CACHE_TTL,
+                keepalive_timeout=CANVAS_KEEPALIVE_TIMEOUT,
+                enable_cleanup_closed=True,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=CANVAS_REQUEST_TIMEOUT),
+                headers={"Accept": "application/json", "Accept-Encoding": ACCEPT_ENCODING},
+                auto_decompress=True,
+            )
+        return self._session
+
+    @staticmethod
+    def token_for(headers):
+        """Extract the Canvas access token from the request headers."""
+        auth = (headers or {}).get("Authorization", "")
+        return auth[len("Bearer "):] if auth.startswith("Bearer ") else auth
+
+    def _limits_for(self, url, headers):
+        """Return the (token, host) semaphores that bound a request."""
+        token = self.token_for(headers)
+        host = urlsplit(url).netloc
+        if token not in self._token_limits:
+            self._token_limits[token] = asyncio.Semaphore(self.max_per_token)
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.max_per_host)
+        return self._token_limits[token], self._host_limits[host]
+
+    async def request(self, method, url, headers=None, params=None, json=None):
+        """Perform a request against Canvas.
+
+        Args:
+            method: HTTP method
+            url: Full Canvas API URL
+            headers: Request headers (usually the Authorization header)
+            params: Query string parameters
+            json: JSON request body
+
+        Returns:
+            A CanvasResponse. ``data`` holds the decoded JSON body on success
+            and is None otherwise.
+
+        Raises:
+            CanvasRateLimited: If Canvas still throttles the token after every retry.
+        """
+        session = self._get_session()
+        token = self.token_for(headers)
+        token_limit, host_limit = self._limits_for(url, headers)
+
+        # Revalidate a cached response instead of downloading it again
+        cache_key = cached = None
+        if method == "GET":
+            cache_key = self.response_cache.key(token, url, params)
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                headers = {**(headers or {}), **cached.conditional_headers()}
+
+        for attempt in range(CANVAS_RATE_LIMIT_RETRIES + 1):
+            await self.rate_limiter.acquire(token)
+            async with token_limit, host_limit:
+                async with session.request(method, url=url, params=params, headers=headers, json=json) as response:
+                    self.rate_limiter.update(token, response.headers)
+                    if response.status == 304 and cached is not None:
+                        return CanvasResponse(200, cached.data, response.headers, cached.links)
+                    if not await self._is_throttled(response):
+                        data = None
+                        if response.status == 200:
+                            body = await response.read()
+                            data = await response.json(content_type=None)
+                            if cache_key is not None:
+                                self._store(cache_key, response, data, len(body))
+                        else:
+                            logger.warning(f"Canvas returned {response.status} for {method} {url}")
+                        return CanvasResponse(response.status, data, response.headers, response.links)
+
+            # Back off outside the concurrency limits so other tokens keep going
+            self.rate_limiter.throttled(token)
+            delay = self.rate_limiter.backoff(attempt)
+            logger.info(f"Canvas throttled {method} {url}, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+        raise CanvasRateLimited(url)
+
+    def _store(self, cache_key, response, data, size):
+        """Cache a successful response if Canvas sent validators for it."""
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if not etag and not last_modified:
+            self.response_cache.pop(cache_key)
+            return
+
+        links = {rel: {"url": str(link["url"])} for rel, link in response.links.items()}
+        self.response_cache.set(cache_key, CachedResponse(etag, last_modified, data, links, size))
+
+    @staticmethod
+    async def _is_throttled(response):
+        """Whether Canvas refused the request because the token's rate limit ran out."""
+        if response.status == 429:
+            return True
+        if response.status == 403:
+            return "Rate Limit Exceeded" in await response.text()
+        return False
+
+    async def get(self, url, headers=None, params=None):
+        """Perform a GET request against Canvas."""
+        return await self.request("GET", url, headers=headers, params=params)
+
+    async def post(self, url, headers=None, json=None):
+        """Perform a POST request with a JSON body against Canvas."""
+        return await self.request("POST", url, headers=headers, json=json)
+
+    async def paginate(self, url, headers=None, params=None, per_page=CANVAS_PAGE_SIZE):
+        """Stream the items of a Canvas list endpoint, following ``Link: rel="next"``.
+
+        Items are yielded as each page arrives, so callers can stop iterating
+        (and call ``aclose()``) once they have enough and no further pages are
+        downloaded.
+
+        Raises:
+            CanvasError: If Canvas returns an error for any page.
+        """
+        params = dict(params or {})
+        params.setdefault("per_page", per_page)
+
+        while url:
+            response = await self.get(url, headers=headers, params=params)
+            if not response.ok:
+                raise CanvasError(response.status, url)
+
+            for item in response.data:
+                yield item
+
+            # The next link already carries every query parameter
+            next_link = response.links.get("next")
+            url = str(next_link["url"]) if next_link else None
+            params = None
+
+    async def get_all(self, url, headers=None, params=None):
+        """Collect every item of a Canvas list endpoint.
+
+        Returns:
+            The list of items, or None if Canvas returned an error.
+        """
+        try:
+            return [item async for item in self.paginate(url, headers=headers, params=params)]
+        except CanvasError:
+            return None
+
+    async def close(self):
+        """Close the session and release all pooled connections."""
+        if not self.closed:
+            await self._session.close()
+        self._session = None
+        self.response_cache.save()
@@ -0,0 +1,73 @@
+"""Shared catalogue of course assignment definitions for the daily runs."""
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+from utils.canvas import CanvasError
+
+# Fields of an assignment that are the same for every student in the course
+SHARED_FIELDS = ("id", "name", "due_at", "submission_types")
+
+
+class AssignmentCatalogue:
+    """Assignment definitions keyed by (Canvas host, course id), fetched once and reused until they expire.
+
+    Listings are requested without per-student due date overrides, and
+    assignments that are only visible to some students are left out, so an
+    entry holds nothing that is specific to the student whose token fetched it.
+    Per-user due dates and submission state must be overlaid separately.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._entries = {}
+        self._fetched_at = {}
+        self.fetches = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def get(self, client, endpoint, headers, course):
+        """Return a course's shared assignment definitions, fetching them on first use.
+
+        Concurrent callers for the same course wait on a single fetch.
+
+        Returns:
+            The list of definitions ordered by due date, or None if Canvas returned an error.
+        """
+        key = (urlsplit(endpoint).netloc, str(course['id']))
+        if key in self._entries and self.ttl is not None and time.monotonic() - self._fetched_at[key] > self.ttl:
+            del self._entries[key]
+        if key not in self._entries:
+            self._entries[key] = asyncio.ensure_future(self._fetch(client, endpoint, headers, course))
+            self._fetched_at[key] = time.monotonic()
+
+        try:
+            return await asyncio.shield(self._entries[key])
+        except Exception as e:
+            # Forget the failure so the next user's token can try again
+            self._entries.pop(key, None)
+            self._fetched_at.pop(key, None)
+            if isinstance(e, CanvasError):
+                return None
+            raise
+
+    def discard_expired(self):
+        """Drop definitions that have outlived the time to live."""
+        if self.ttl is None:
+            return
+        cutoff = time.monotonic() - self.ttl
+        for key in [key for key, fetched_at in self._fetched_at.items() if fetched_at < cutoff]:
+            self._entries.pop(key, None)
+            self._fetched_at.pop(key, None)
+
+    async def _fetch(self, client, endpoint, headers, course):
+        self.fetches += 1
+        params = {"order_by": "due_at", "override_assignment_dates": "false"}
+        definitions = []
+        async for assignment in client.paginate(f"{endpoint}/courses/{course['id']}/assignments", headers=headers, params=params):
+            # Only share what every student can see; a teacher's token also lists unpublished assignments
+            if assignment.get('only_visible_to_overrides') or assignment.get('published') is False:
+                continue
+            definitions.append({field: assignment.get(field) for field in SHARED_FIELDS})
+        return definitions
@@ -1,4 +1,5 @@
 import os
+import socket
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -17,3 +18,127 @@ DEVELOPER_IDS = [
 
 # Base API URL for Canvas
 BASE_API = "https://poway.instructure.com/api/v1"
+
+# Canvas HTTP client connection pooling
+CANVAS_CONNECTION_LIMIT = int(os.getenv("CANVAS_CONNECTION_LIMIT", "100"))
+CANVAS_CONNECTION_LIMIT_PER_HOST = int(os.getenv("CANVAS_CONNECTION_LIMIT_PER_HOST", "20"))
+CANVAS_DNS_CACHE_TTL = int(os.getenv("CANVAS_DNS_CACHE_TTL", "300"))  # seconds
+CANVAS_KEEPALIVE_TIMEOUT = float(os.getenv("CANVAS_KEEPALIVE_TIMEOUT", "30"))  # seconds
+CANVAS_REQUEST_TIMEOUT = float(os.getenv("CANVAS_REQUEST_TIMEOUT", "30"))  # seconds
+
+# Canvas request concurrency limits
+CANVAS_MAX_CONCURRENCY_PER_TOKEN = int(os.getenv("CANVAS_MAX_CONCURRENCY_PER_TOKEN", "8"))
+CANVAS_MAX_CONCURRENCY_PER_HOST = int(os.getenv("CANVAS_MAX_CONCURRENCY_PER_HOST", "16"))
+
+# How get_homework fetches assignments: "buckets" (three requests per course),
+# "single" (one request per course, bucketed locally) or "planner" (one
+# cross-course planner listing per user, falling back to "single")
+HOMEWORK_FETCH_MODE = os.getenv("HOMEWORK_FETCH_MODE", "single")
+
+# Per-institution fetch mode overrides, e.g. "canvas.example.edu=graphql,other.instructure.com=planner".
+# "graphql" fetches every course in one GraphQL query and falls back to "single".
+HOMEWORK_FETCH_MODE_OVERRIDES = dict(
+    entry.strip().split("=", 1)
+    for entry in os.getenv("HOMEWORK_FETCH_MODE_OVERRIDES", "").split(",")
+    if "=" in entry
+)
+
+# How far back the planner backend looks for overdue assignments
+PLANNER_OVERDUE_LOOKBACK_DAYS = int(os.getenv("PLANNER_OVERDUE_LOOKBACK_DAYS", "30"))
+
+# Items requested per page from Canvas list endpoints
+CANVAS_PAGE_SIZE = int(os.getenv("CANVAS_PAGE_SIZE", "100"))
+
+# Canvas per-token rate limiting (Canvas uses a leaky bucket, reported through
+# the X-Rate-Limit-Remaining and X-Request-Cost response headers)
+CANVAS_RATE_LIMIT_BUCKET = float(os.getenv("CANVAS_RATE_LIMIT_BUCKET", "700"))
+CANVAS_RATE_LIMIT_LEAK_RATE = float(os.getenv("CANVAS_RATE_LIMIT_LEAK_RATE", "10"))  # units per second
+CANVAS_RATE_LIMIT_LOW_WATER = float(os.getenv("CANVAS_RATE_LIMIT_LOW_WATER", "150"))
+CANVAS_RATE_LIMIT_RETRIES = int(os.getenv("CANVAS_RATE_LIMIT_RETRIES", "4"))
+CANVAS_RATE_LIMIT_BACKOFF = float(os.getenv("CANVAS_RATE_LIMIT_BACKOFF", "1"))  # seconds, doubled per retry
+
+# Per-user course list cache
+COURSE_CACHE_TTL = int(os.getenv("COURSE_CACHE_TTL", "21600"))  # seconds
+COURSE_CACHE_SIZE = int(os.getenv("COURSE_CACHE_SIZE", "5000"))
+
+# Conditional GET (ETag / Last-Modified) cache for Canvas responses
+HTTP_CACHE_SIZE = int(os.getenv("HTTP_CACHE_SIZE", "2000"))  # entries
+HTTP_CACHE_MAX_BYTES = int(os.getenv("HTTP_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+HTTP_CACHE_PERSIST = os.getenv("HTTP_CACHE_PERSIST", "0") == "1"  # keep the cache in data/canvasbot.db
+
+# Share course assignment definitions across users of the planner backend during the daily run.
+# Off by default: an undated assignment restricted to sections the sharing token can't see is missed
+SHARED_CATALOGUE = os.getenv("SHARED_CATALOGUE", "0") == "1"
+
+# Daily homework run: workers per pipeline stage and the bounded queue size between stages
+DAILY_ELIGIBLE_WORKERS = int(os.getenv("DAILY_ELIGIBLE_WORKERS", "1"))
+DAILY_COURSE_WORKERS = int(os.getenv("DAILY_COURSE_WORKERS", "8"))
+DAILY_ASSIGNMENT_WORKERS = int(os.getenv("DAILY_ASSIGNMENT_WORKERS", "8"))
+DAILY_RENDER_WORKERS = int(os.getenv("DAILY_RENDER_WORKERS", "2"))
+DAILY_DELIVER_WORKERS = int(os.getenv("DAILY_DELIVER_WORKERS", "4"))
+DAILY_QUEUE_SIZE = int(os.getenv("DAILY_QUEUE_SIZE", "50"))
+
+# Default daily reminder delivery time for users who haven't chosen one
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE", "America/Los_Angeles")
+DEFAULT_DELIVERY_TIME = os.getenv("DEFAULT_DELIVERY_TIME", "05:00")  # HH:MM, local time
+
+# Daily reminders are spread over a window centred on each user's delivery time,
+# e.g. 60 minutes turns 05:00 into 04:30-05:30, with a stable offset per user
+DELIVERY_WINDOW_MINUTES = int(os.getenv("DELIVERY_WINDOW_MINUTES", "60"))
+# Minimum pace (users per second) of the daily run's Canvas fetches and Discord sends
+DAILY_MIN_RATE = float(os.getenv("DAILY_MIN_RATE", "0.5"))
+# Headroom over the rate needed to finish each window's users within the window
+DAILY_RATE_HEADROOM = float(os.getenv("DAILY_RATE_HEADROOM", "1.5"))
+
+# Daily digests are fetched and rendered this long before their delivery time
+PREFETCH_LEAD_MINUTES = int(os.getenv("PREFETCH_LEAD_MINUTES", "30"))
+# How long shared course assignment definitions are reused across daily runs
+CATALOGUE_TTL_MINUTES = int(os.getenv("CATALOGUE_TTL_MINUTES", "60"))
+
+# Unfinished daily runs younger than this are resumed on startup
+DAILY_RESUME_HOURS = int(os.getenv("DAILY_RESUME_HOURS", "6"))
+# A user's daily job is given up after this many failed attempts
+DAILY_MAX_ATTEMPTS = int(os.getenv("DAILY_MAX_ATTEMPTS", "3"))
+# A failed daily job is retried this many seconds after its failure, doubling with each attempt
+DAILY_RETRY_BACKOFF_SECONDS = int(os.getenv("DAILY_RETRY_BACKOFF_SECONDS", "300"))
+
+# Role of this process in the daily run: "standalone" (one process does everything),
+# "coordinator" (gateway bot that also takes a share of users) or "worker" (headless, no gateway)
+DAILY_ROLE = os.getenv("DAILY_ROLE", "standalone")
+# Number of user partitions leased out to the processes sharing the daily run
+DAILY_PARTITIONS = int(os.getenv("DAILY_PARTITIONS", "64"))
+# How long a partition lease lasts without being renewed, in seconds
+LEASE_TTL_SECONDS = int(os.getenv("LEASE_TTL_SECONDS", "60"))
+# Identifies this process in the lease table
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+# How often workers reload delivery settings changed through another process, in minutes
+SCHEDULE_SYNC_MINUTES = int(os.getenv("SCHEDULE_SYNC_MINUTES", "5"))
+
+# Messages per second the outbox lets daily batch traffic send (Discord's global limit is 50)
+DISCORD_BATCH_RATE = float(os.getenv("DISCORD_BATCH_RATE", "40"))
+
+# How long a database query waits for another connection's write lock, in milliseconds
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+# Buffered user writes are committed together after this many seconds...
+DB_FLUSH_INTERVAL = float(os.getenv("DB_FLUSH_INTERVAL", "0.5"))
+# ...or as soon as this many users have pending changes
+DB_WRITE_BATCH_SIZE = int(os.getenv("DB_WRITE_BATCH_SIZE", "100"))
+
+# Maximum number of user rows kept in memory by the database
+DB_ROW_CACHE_SIZE = int(os.getenv("DB_ROW_CACHE_SIZE", "10000"))
+# How long a cached user row is trusted, in seconds (bounds staleness from other processes)
+DB_ROW_CACHE_TTL = int(os.getenv("DB_ROW_CACHE_TTL", "300"))
+
+# Where /homework reads assignments from: "live" (Canvas) or "replica" (the local copy kept by a background sync)
+HOMEWORK_BACKEND = os.getenv("HOMEWORK_BACKEND", "live")
+# How often each user's replica is synced from Canvas, in minutes
+REPLICA_SYNC_MINUTES = int(os.getenv("REPLICA_SYNC_MINUTES", "60"))
+# Replicas older than this are ignored and /homework asks Canvas instead, in minutes
+REPLICA_MAX_AGE_MINUTES = int(os.getenv("REPLICA_MAX_AGE_MINUTES", "240"))
+# Days of assignments synced ahead; keep it above /homework's longest look-ahead (30 days)
+REPLICA_HORIZON_DAYS = int(os.getenv("REPLICA_HORIZON_DAYS", "32"))
+
+# JSON backend: the change log is compacted into users.json this many seconds after a write...
+JSON_COMPACT_INTERVAL = float(os.getenv("JSON_COMPACT_INTERVAL", "60"))
+# ...or as soon as it holds this many changes
+JSON_COMPACT_ENTRIES = int(os.getenv("JSON_COMPACT_ENTRIES", "1000"))
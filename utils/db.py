@@ -1,36 +1,162 @@
 import os
 import json
+import logging
+import threading
 from pathlib import Path
 
-# Database file path
+from utils.config import JSON_COMPACT_ENTRIES, JSON_COMPACT_INTERVAL
+
+logger = logging.getLogger('canvasbot.db')
+
+# Database file path; holds the snapshot the change log is compacted into
 DB_FILE = Path(__file__).parent.parent / "data" / "users.json"
 
 # Ensure the data directory exists
 Path(DB_FILE.parent).mkdir(exist_ok=True)
 
+def log_files(path):
+    """Return a snapshot's change logs in replay order.
+
+    The first is the log being compacted, which only survives if the bot stopped
+    mid-compaction; the second is the append-only log of the changes made since,
+    one JSON object per line.
+    """
+    return path.with_name(path.name + ".log.compacting"), path.with_name(path.name + ".log")
+
+COMPACTING_LOG_FILE, LOG_FILE = log_files(DB_FILE)
+
+def replay_log(data, log_file):
+    """Apply the changes recorded in a change log to data.
+
+    A torn last line, left by a crash in the middle of an append, is ignored.
+
+    Returns:
+        The number of changes applied.
+    """
+    if not log_file.exists():
+        return 0
+
+    applied = 0
+    with open(log_file, 'r') as f:
+        for line in f:
+            try:
+                change = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"Ignoring an incomplete change at the end of {log_file.name}")
+                break
+            data[change["key"]] = change["value"]
+            applied += 1
+    return applied
+
+def load_json_state(path=DB_FILE):
+    """Read a JSON database's snapshot and replay its change logs, without writing anything.
+
+    Raises:
+        json.JSONDecodeError: If the snapshot is not valid JSON.
+    """
+    data = {}
+    if path.exists():
+        with open(path, 'r') as f:
+            data = json.load(f)
+    for log_file in log_files(path):
+        replay_log(data, log_file)
+    return data
+
+def write_atomically(path, text):
+    """Replace a file's contents so readers see either the old file or the new one, never a partial write."""
+    temp_path = path.with_name(path.name + ".tmp")
+    with open(temp_path, 'w') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
 class Database:
-    """A simple JSON-based database for storing user data."""
+    """A simple JSON-based database for storing user data.
+    
+    Writes are appended to a change log instead of rewriting users.json, and
+    the log is compacted into a new users.json in the background
+    JSON_COMPACT_INTERVAL seconds after a write, or once it holds
+    JSON_COMPACT_ENTRIES changes.
+    """
     
     def __init__(self):
         self.data = {}
+        self._lock = threading.Lock()
+        self._log = None
+        self._log_entries = 0
+        self._compact_timer = None
+        # Held for a whole compaction so snapshots are never written out of order
+        self._compaction_lock = threading.Lock()
         self.load()
     
     def load(self):
-        """Load data from the database file."""
-        if DB_FILE.exists():
-            try:
-                with open(DB_FILE, 'r') as f:
-                    self.data = json.load(f)
-            except json.JSONDecodeError:
-                self.data = {}
-                self.save()  # Create a new empty database file
-        else:
-            self.save()  # Create a new empty database file
+        """Load the snapshot and replay the change logs written since it."""
+        try:
+            self.data = load_json_state(DB_FILE)
+        except json.JSONDecodeError:
+            # Snapshots are replaced atomically, so this is a file edited or damaged outside the bot;
+            # keep it for inspection instead of overwriting it
+            logger.error(f"{DB_FILE.name} is not valid JSON, moving it aside and starting from the change logs alone")
+            os.replace(DB_FILE, DB_FILE.with_name(DB_FILE.name + ".corrupt"))
+            self.data = load_json_state(DB_FILE)
+        
+        # Start from a fresh snapshot so a torn line at the end of a log is never appended to
+        if COMPACTING_LOG_FILE.exists() or LOG_FILE.exists() or not DB_FILE.exists():
+            self.save()
     
     def save(self):
-        """Save data to the database file."""
-        with open(DB_FILE, 'w') as f:
-            json.dump(self.data, f, indent=4)
+        """Write the whole database to the snapshot now and clear the change logs."""
+        with self._compaction_lock, self._lock:
+            write_atomically(DB_FILE, json.dumps(self.data))
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+            for log_file in (LOG_FILE, COMPACTING_LOG_FILE):
+                if log_file.exists():
+                    log_file.unlink()
+            self._log_entries = 0
+    
+    def compact(self):
+        """Fold the change log into the snapshot without holding up writes for the disk I/O.
+        
+        The current log is set aside and new writes go to a fresh one. Should the
+        bot stop before the new snapshot is in place, the next load replays the
+        set-aside log on top of the old snapshot.
+        """
+        with self._compaction_lock:
+            with self._lock:
+                if self._compact_timer is not None:
+                    self._compact_timer.cancel()
+                    self._compact_timer = None
+                if not self._log_entries:
+                    return
+                snapshot = json.dumps(self.data)
+                if self._log is not None:
+                    self._log.close()
+                    self._log = None
+                if COMPACTING_LOG_FILE.exists():
+                    # The last compaction failed; keep its changes until a snapshot includes them
+                    with open(LOG_FILE, 'r') as src, open(COMPACTING_LOG_FILE, 'a') as dst:
+                        dst.write(src.read())
+                    LOG_FILE.unlink()
+                else:
+                    os.replace(LOG_FILE, COMPACTING_LOG_FILE)
+                self._log_entries = 0
+            
+            try:
+                write_atomically(DB_FILE, snapshot)
+                COMPACTING_LOG_FILE.unlink()
+            except OSError as e:
+                logger.error(f"Failed to compact {LOG_FILE.name}: {e}")
+    
+    def close(self):
+        """Compact any logged changes and close the change log."""
+        self.compact()
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
     
     def __contains__(self, key):
         """Check if a key exists in the database."""
@@ -41,9 +167,23 @@ class Database:
         return self.data.get(str(key), None)
     
     def __setitem__(self, key, value):
-        """Set a value in the database."""
-        self.data[str(key)] = value
-        self.save()
+        """Set a value in the database by appending the change to the log."""
+        line = json.dumps({"key": str(key), "value": value}) + "\n"
+        with self._lock:
+            self.data[str(key)] = value
+            if self._log is None:
+                self._log = open(LOG_FILE, 'a')
+            self._log.write(line)
+            self._log.flush()
+            self._log_entries += 1
+            compact_now = self._log_entries >= JSON_COMPACT_ENTRIES
+            if not compact_now and self._compact_timer is None:
+                self._compact_timer = threading.Timer(JSON_COMPACT_INTERVAL, self.compact)
+                self._compact_timer.daemon = True
+                self._compact_timer.start()
+        
+        if compact_now:
+            threading.Thread(target=self.compact, daemon=True).start()
     
     def keys(self):
         """Get all keys in the database."""
@@ -61,5 +201,17 @@ class Database:
         """Get a value from the database with a default fallback."""
         return self.data.get(str(key), default)
 
-# Create a database instance
-db = Database()
+# The shared database instance, created on first use so importing this module
+# (e.g. to migrate to SQLite) doesn't compact or rewrite users.json
+_db = None
+_db_lock = threading.Lock()
+
+def __getattr__(name):
+    """Create the module's ``db`` instance when it is first accessed."""
+    global _db
+    if name != "db":
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _db_lock:
+        if _db is None:
+            _db = Database()
+    return _db
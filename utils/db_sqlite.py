@@ -1,10 +1,26 @@
 import os
 import json
 import sqlite3
+import asyncio
+import functools
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
 import pytz
 
+from utils.cache import TTLCache
+from utils.config import (
+    DB_BUSY_TIMEOUT_MS,
+    DB_FLUSH_INTERVAL,
+    DB_ROW_CACHE_SIZE,
+    DB_ROW_CACHE_TTL,
+    DB_WRITE_BATCH_SIZE,
+    DEFAULT_DELIVERY_TIME,
+    DEFAULT_TIMEZONE,
+)
+
 # Database file path
 DB_PATH = Path(__file__).parent.parent / "data"
 DB_FILE = DB_PATH / "canvasbot.db"
@@ -16,13 +32,82 @@ DB_PATH.mkdir(exist_ok=True)
 JSON_DB_FILE = DB_PATH / "users.json"
 
 
+def on_db_thread(method):
+    """Run a Database method on the database's own thread.
+    
+    Called from any other thread (such as the event loop), the call is handed to
+    the database thread and waited for, so the connection is only ever used by
+    one thread. Called on the database thread itself, it runs directly.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if threading.get_ident() == self._thread_id:
+            return method(self, *args, **kwargs)
+        return self.executor.submit(method, self, *args, **kwargs).result()
+    return wrapper
+
+
+# User data keys and the users columns they are stored in
+SETTING_COLUMNS = {
+    'id': 'canvas_token',
+    'endpoint': 'endpoint',
+    'daily': 'daily',
+    'ping': 'ping',
+    'dm': 'dm',
+    'starred': 'starred',
+    'muted_until': 'muted_until',
+    'timezone': 'timezone',
+    'delivery_time': 'delivery_time',
+    'changes': 'changes_only',
+}
+
+# Values used when a saved user leaves a setting out
+SETTING_DEFAULTS = {'daily': True, 'ping': True, 'dm': True, 'starred': False, 'changes': False}
+
+# Column values of a user row that has not been written yet
+NEW_USER_ROW = {
+    'canvas_token': None, 'endpoint': None, 'daily': 1, 'ping': 1, 'dm': 1, 'starred': 0,
+    'muted_until': None, 'timezone': None, 'delivery_time': None, 'changes_only': 0, 'dm_channel_id': None,
+}
+
+
+# An immutable copy of the user columns, as kept in the row cache
+UserRecord = namedtuple('UserRecord', NEW_USER_ROW)
+
+# Marks a user missing from the row cache (as opposed to a cached missing user)
+_NOT_CACHED = object()
+
+
 class Database:
-    """SQLite database for storing user data."""
+    """SQLite database for storing user data.
+    
+    All queries run on a dedicated thread. The dict-style API blocks until its
+    query is done; coroutines should use ``AsyncDatabase`` (``adb``) instead,
+    which awaits the same queries without blocking the event loop.
+    
+    Writes are buffered and committed together after DB_FLUSH_INTERVAL seconds
+    or once DB_WRITE_BATCH_SIZE users have pending changes. Reads of a single
+    user see buffered changes; bulk queries flush first. Call ``flush`` (or
+    ``close``) before shutting down.
+    
+    Single-user lookups are served from an LRU cache of immutable user records
+    (including users that don't exist), which every write invalidates.
+    """
     
     def __init__(self):
         """Initialize the database connection and create tables if they don't exist."""
         self.conn = None
         self.cursor = None
+        self._thread_id = None
+        # Buffered writes: user id -> {'insert': bool, 'columns': {column: value}}
+        self._pending = {}
+        self._flush_timer = None
+        self.writes = 0
+        self.flushes = 0
+        self.row_cache = TTLCache(DB_ROW_CACHE_SIZE, DB_ROW_CACHE_TTL)
+        self.row_cache_hits = 0
+        self.row_cache_misses = 0
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="canvasbot-db", initializer=self._mark_thread)
         self.connect()
         self.create_tables()
         
@@ -30,17 +115,33 @@ class Database:
         if JSON_DB_FILE.exists() and self.is_empty():
             self.migrate_from_json()
     
+    def _mark_thread(self):
+        self._thread_id = threading.get_ident()
+    
     def connect(self):
         """Connect to the SQLite database."""
-        self.conn = sqlite3.connect(DB_FILE)
+        # The connection is created here but only used on the database thread afterwards
+        self.conn = sqlite3.connect(DB_FILE, check_same_thread=False, timeout=DB_BUSY_TIMEOUT_MS / 1000)
         # Enable dictionary access to rows
         self.conn.row_factory = sqlite3.Row
         self.cursor = self.conn.cursor()
+        # WAL lets readers in other connections and processes work alongside a writer,
+        # and NORMAL only syncs at checkpoints, which is safe in WAL mode
+        self.cursor.execute("PRAGMA journal_mode=WAL")
+        self.cursor.execute("PRAGMA synchronous=NORMAL")
+        self.cursor.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
     
     def close(self):
-        """Close the database connection."""
+        """Flush buffered writes, close the database connection and stop the database thread."""
+        self.flush()
         if self.conn:
-            self.conn.close()
+            self.executor.submit(self.conn.close).result()
+        self.executor.shutdown()
+    
+    async def run(self, func, *args, **kwargs):
+        """Await ``func(*args, **kwargs)`` on the database thread."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
     
     def create_tables(self):
         """Create the necessary tables if they don't exist."""
@@ -54,12 +155,32 @@ class Database:
                 dm BOOLEAN DEFAULT 1,
                 starred BOOLEAN DEFAULT 0,
                 muted_until TEXT DEFAULT NULL,
+                timezone TEXT DEFAULT NULL,
+                delivery_time TEXT DEFAULT NULL,
+                changes_only BOOLEAN DEFAULT 0,
+                dm_channel_id TEXT DEFAULT NULL,
                 created_at TEXT DEFAULT CURRENT_TIMESTAMP,
                 updated_at TEXT DEFAULT CURRENT_TIMESTAMP
             )
         ''')
+        self.add_missing_columns('users', {
+            'timezone': 'TEXT DEFAULT NULL',
+            'delivery_time': 'TEXT DEFAULT NULL',
+            'changes_only': 'BOOLEAN DEFAULT 0',
+            'dm_channel_id': 'TEXT DEFAULT NULL',
+        })
+        # Users are paged and looked up by user_id, so this index only added write cost
+        self.cursor.execute("DROP INDEX IF EXISTS users_daily_muted")
         self.conn.commit()
     
+    def add_missing_columns(self, table, columns):
+        """Add columns introduced after a table was first created."""
+        self.cursor.execute(f"PRAGMA table_info({table})")
+        existing = {row[1] for row in self.cursor.fetchall()}
+        for name, definition in columns.items():
+            if name not in existing:
+                self.cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+    
     def is_empty(self):
         """Check if the users table is empty."""
         self.cursor.execute("SELECT COUNT(*) FROM users")
@@ -69,8 +190,10 @@ class Database:
     def migrate_from_json(self):
         """Migrate data from the JSON database to SQLite."""
         try:
-            with open(JSON_DB_FILE, 'r') as f:
-                json_data = json.load(f)
+            # Include changes the JSON backend logged but had not compacted into users.json yet;
+            # this only reads the files and leaves them as they are
+            from utils.db import load_json_state
+            json_data = load_json_state(JSON_DB_FILE)
                 
             # Insert each user from the JSON file
             for user_id, user_data in json_data.items():
@@ -102,93 +225,307 @@ class Database:
         except Exception as e:
             print(f"Error migrating from JSON: {e}")
     
+    @on_db_thread
     def __contains__(self, key):
         """Check if a user exists in the database."""
-        self.cursor.execute("SELECT 1 FROM users WHERE user_id = ?", (str(key),))
-        return self.cursor.fetchone() is not None
+        return self._record(str(key)) is not None
     
+    @on_db_thread
     def __getitem__(self, key):
-        """Get a user's data from the database."""
-        self.cursor.execute("SELECT * FROM users WHERE user_id = ?", (str(key),))
+        """Get a user's data from the database, including writes not yet flushed."""
+        record = self._record(str(key))
+        if record is not None:
+            return self.row_to_user(record._asdict())
+        return None
+    
+    def _record(self, user_id):
+        """Return a user's cached record, loading it on a miss; None if the user doesn't exist."""
+        record = self.row_cache.get(user_id, _NOT_CACHED)
+        if record is not _NOT_CACHED:
+            self.row_cache_hits += 1
+            return record
+        
+        self.row_cache_misses += 1
+        self.cursor.execute(f"SELECT {', '.join(UserRecord._fields)} FROM users WHERE user_id = ?", (user_id,))
         row = self.cursor.fetchone()
         
-        if row:
-            # Convert SQLite row to dictionary
-            user_data = dict(row)
-            
-            # Map keys to match the old JSON format
-            result = {
-                'id': user_data['canvas_token'],
-                'endpoint': user_data['endpoint'],
-                'daily': bool(user_data['daily']),
-                'ping': bool(user_data['ping']),
-                'dm': bool(user_data['dm']),
-                'starred': bool(user_data['starred']),
-            }
+        pending = self._pending.get(user_id)
+        # An update buffered for a user who doesn't exist yet is a no-op
+        if pending is not None and (row is not None or pending['insert']):
+            row = {**(dict(row) if row else NEW_USER_ROW), **pending['columns']}
+        
+        record = UserRecord(**dict(row)) if row else None
+        self.row_cache.set(user_id, record)
+        return record
+    
+    def row_cache_stats(self):
+        """Return the row cache's size and hit/miss counters."""
+        lookups = self.row_cache_hits + self.row_cache_misses
+        return {
+            'size': len(self.row_cache),
+            'hits': self.row_cache_hits,
+            'misses': self.row_cache_misses,
+            'hit_rate': self.row_cache_hits / lookups if lookups else 0.0,
+        }
+    
+    @staticmethod
+    def row_to_user(row):
+        """Convert a users row into the dictionary format of the old JSON database."""
+        # Convert SQLite row to dictionary
+        user_data = dict(row)
+        
+        # Map keys to match the old JSON format
+        result = {
+            'id': user_data['canvas_token'],
+            'endpoint': user_data['endpoint'],
+            'daily': bool(user_data['daily']),
+            'ping': bool(user_data['ping']),
+            'dm': bool(user_data['dm']),
+            'starred': bool(user_data['starred']),
+            'timezone': user_data['timezone'] or DEFAULT_TIMEZONE,
+            'delivery_time': user_data['delivery_time'] or DEFAULT_DELIVERY_TIME,
+            'changes': bool(user_data['changes_only']),
+            'dm_channel_id': user_data['dm_channel_id'],
+        }
+        
+        # Add muted_until only if it exists
+        if user_data['muted_until']:
+            result['muted_until'] = user_data['muted_until']
             
-            # Add muted_until only if it exists
-            if user_data['muted_until']:
-                result['muted_until'] = user_data['muted_until']
-                
-            return result
-        return None
+        return result
     
+    @on_db_thread
     def __setitem__(self, key, value):
-        """Set or update a user's data in the database."""
-        user_id = str(key)
+        """Set or update a user's data in the database.
+        
+        The write is buffered and upserted with the next flush.
+        """
+        columns = {
+            column: value.get(setting, SETTING_DEFAULTS.get(setting))
+            for setting, column in SETTING_COLUMNS.items()
+        }
+        self._buffer(str(key), columns, insert=True)
+    
+    @on_db_thread
+    def update_user(self, key, **settings):
+        """Update only the given settings of an existing user.
+        
+        Settings use the same names as the user data dictionary (e.g.
+        ``update_user(user_id, starred=True)``), plus ``dm_channel_id``.
+        
+        Raises:
+            KeyError: If a setting does not exist.
+        """
+        columns = {}
+        for setting, value in settings.items():
+            if setting not in SETTING_COLUMNS and setting != 'dm_channel_id':
+                raise KeyError(setting)
+            columns[SETTING_COLUMNS.get(setting, setting)] = value
+        self._buffer(str(key), columns, insert=False)
+    
+    def set_dm_channel(self, key, channel_id):
+        """Remember the id of a user's DM channel, or forget it with None.
+        
+        The DM channel is not part of the settings written by __setitem__, so
+        saving settings never clears it.
+        """
+        self.update_user(key, dm_channel_id=str(channel_id) if channel_id is not None else None)
+    
+    def _buffer(self, user_id, columns, insert):
+        """Queue column writes for a user, merging them with any still pending."""
+        self.row_cache.pop(user_id)
+        pending = self._pending.setdefault(user_id, {'insert': False, 'columns': {}})
+        pending['insert'] = pending['insert'] or insert
+        pending['columns'].update(columns)
+        self.writes += 1
+        
+        if len(self._pending) >= DB_WRITE_BATCH_SIZE:
+            self.flush()
+        elif self._flush_timer is None:
+            self._flush_timer = threading.Timer(DB_FLUSH_INTERVAL, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+    
+    @on_db_thread
+    def flush(self):
+        """Write every buffered change in a single transaction."""
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        if not self._pending:
+            return
+        
         now = datetime.now(pytz.UTC).isoformat()
+        with self.conn:
+            for user_id, pending in self._pending.items():
+                columns = pending['columns']
+                if pending['insert']:
+                    names = ', '.join(columns)
+                    placeholders = ', '.join('?' * len(columns))
+                    updates = ', '.join(f"{name} = excluded.{name}" for name in columns)
+                    self.cursor.execute(
+                        f"INSERT INTO users (user_id, {names}, created_at, updated_at) VALUES (?, {placeholders}, ?, ?) "
+                        f"ON CONFLICT(user_id) DO UPDATE SET {updates}, updated_at = excluded.updated_at",
+                        (user_id, *columns.values(), now, now)
+                    )
+                else:
+                    assignments = ', '.join(f"{name} = ?" for name in columns)
+                    self.cursor.execute(
+                        f"UPDATE users SET {assignments}, updated_at = ? WHERE user_id = ?",
+                        (*columns.values(), now, user_id)
+                    )
+        self._pending.clear()
+        self.flushes += 1
+    
+    @on_db_thread
+    def clear_expired_mutes(self, now=None):
+        """Clear every mute that has run out in one statement.
         
-        # Check if user exists
-        if user_id in self:
-            # Update existing user
-            self.cursor.execute('''
-                UPDATE users SET
-                canvas_token = ?,
-                endpoint = ?,
-                daily = ?,
-                ping = ?,
-                dm = ?,
-                starred = ?,
-                muted_until = ?,
-                updated_at = ?
-                WHERE user_id = ?
-            ''', (
-                value.get('id'),
-                value.get('endpoint'),
-                value.get('daily', True),
-                value.get('ping', True),
-                value.get('dm', True),
-                value.get('starred', False),
-                value.get('muted_until'),
-                now,
-                user_id
-            ))
-        else:
-            # Insert new user
-            self.cursor.execute('''
-                INSERT INTO users
-                (user_id, canvas_token, endpoint, daily, ping, dm, starred, muted_until, created_at, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                user_id,
-                value.get('id'),
-                value.get('endpoint'),
-                value.get('daily', True),
-                value.get('ping', True),
-                value.get('dm', True),
-                value.get('starred', False),
-                value.get('muted_until'),
-                now,
-                now
-            ))
+        Mutes are stored as UTC ISO timestamps, so they compare correctly as text.
         
+        Returns:
+            The number of users unmuted.
+        """
+        self.flush()
+        now = (now or datetime.now(pytz.UTC)).isoformat()
+        self.cursor.execute(
+            "UPDATE users SET muted_until = NULL, updated_at = ? WHERE muted_until IS NOT NULL AND muted_until <= ?",
+            (now, now)
+        )
         self.conn.commit()
+        if self.cursor.rowcount:
+            self.row_cache.clear()
+        return self.cursor.rowcount
+    
+    def iter_users(self, chunk_size=500, daily_only=False, eligible_only=False, now=None):
+        """Stream users in chunks instead of loading them one query at a time.
+        
+        Args:
+            chunk_size: Number of users per chunk
+            daily_only: Only include users with daily reminders on
+            eligible_only: Only include users with daily reminders on and no active mute
+            now: Time used to decide whether a mute is active (default: now in UTC)
+        
+        Yields:
+            Lists of (user_id, user_data) pairs, ordered by user id.
+        """
+        conditions, params = self.user_filters(daily_only, eligible_only, now)
+        
+        # Page by user id so each chunk is an index range scan, not an OFFSET skip
+        last_user_id = ""
+        while True:
+            chunk = self.users_after(last_user_id, chunk_size, conditions, params)
+            if not chunk:
+                return
+            yield chunk
+            last_user_id = chunk[-1][0]
+    
+    @staticmethod
+    def user_filters(daily_only=False, eligible_only=False, now=None):
+        """Build the WHERE conditions and parameters for iter_users."""
+        conditions = []
+        params = []
+        if daily_only or eligible_only:
+            conditions.append("daily = 1")
+        if eligible_only:
+            conditions.append("(muted_until IS NULL OR muted_until <= ?)")
+            params.append((now or datetime.now(pytz.UTC)).isoformat())
+        return conditions, params
+    
+    @on_db_thread
+    def users_after(self, last_user_id, chunk_size, conditions=(), params=()):
+        """Return up to ``chunk_size`` (user_id, user_data) pairs with ids after ``last_user_id``."""
+        self.flush()
+        rows = self.conn.execute(
+            f"SELECT * FROM users WHERE {' AND '.join([*conditions, 'user_id > ?'])} ORDER BY user_id LIMIT ?",
+            (*params, last_user_id, chunk_size)
+        ).fetchall()
+        return [(row['user_id'], self.row_to_user(row)) for row in rows]
     
+    @on_db_thread
+    def eligible_users(self, user_ids, now=None):
+        """Return the data of the given users who have daily reminders on and no active mute.
+        
+        Returns:
+            A dict of user id to user data; ineligible and unknown users are left out.
+        """
+        self.flush()
+        now = (now or datetime.now(pytz.UTC)).isoformat()
+        user_ids = [str(user_id) for user_id in user_ids]
+        eligible = {}
+        # Stay well under SQLite's limit on query parameters
+        for start in range(0, len(user_ids), 500):
+            chunk = user_ids[start:start + 500]
+            rows = self.conn.execute(
+                f"SELECT * FROM users WHERE user_id IN ({', '.join('?' * len(chunk))}) "
+                "AND daily = 1 AND (muted_until IS NULL OR muted_until <= ?)",
+                (*chunk, now)
+            ).fetchall()
+            eligible.update((row['user_id'], self.row_to_user(row)) for row in rows)
+        return eligible
+    
+    @on_db_thread
     def keys(self):
         """Get all user IDs in the database."""
+        self.flush()
         self.cursor.execute("SELECT user_id FROM users")
         return [row[0] for row in self.cursor.fetchall()]
 
 
+class AsyncDatabase:
+    """Awaitable access to a Database that keeps SQLite I/O off the event loop."""
+    
+    def __init__(self, database):
+        self.database = database
+    
+    async def get(self, key):
+        """Get a user's data, or None."""
+        return await self.database.run(self.database.__getitem__, key)
+    
+    async def set(self, key, value):
+        """Set or update a user's data."""
+        await self.database.run(self.database.__setitem__, key, value)
+    
+    async def contains(self, key):
+        """Check if a user exists."""
+        return await self.database.run(self.database.__contains__, key)
+    
+    async def keys(self):
+        """Get all user IDs."""
+        return await self.database.run(self.database.keys)
+    
+    async def update_user(self, key, **settings):
+        """Update only the given settings of an existing user."""
+        await self.database.run(self.database.update_user, key, **settings)
+    
+    async def flush(self):
+        """Write every buffered change."""
+        await self.database.run(self.database.flush)
+    
+    async def set_dm_channel(self, key, channel_id):
+        """Remember the id of a user's DM channel."""
+        await self.database.run(self.database.set_dm_channel, key, channel_id)
+    
+    async def clear_expired_mutes(self, now=None):
+        """Clear every mute that has run out."""
+        return await self.database.run(self.database.clear_expired_mutes, now)
+    
+    async def eligible_users(self, user_ids, now=None):
+        """Return the data of the given users who have daily reminders on and no active mute."""
+        return await self.database.run(self.database.eligible_users, list(user_ids), now)
+    
+    async def iter_users(self, chunk_size=500, daily_only=False, eligible_only=False, now=None):
+        """Stream users in chunks of (user_id, user_data) pairs, like Database.iter_users."""
+        conditions, params = self.database.user_filters(daily_only, eligible_only, now)
+        last_user_id = ""
+        while True:
+            chunk = await self.database.run(self.database.users_after, last_user_id, chunk_size, conditions, params)
+            if not chunk:
+                return
+            yield chunk
+            last_user_id = chunk[-1][0]
+
+
 # Initialize the database
 db = Database()
+adb = AsyncDatabase(db)
@@ -0,0 +1,67 @@
+"""Prefetched daily homework digests waiting for their delivery time."""
+import hashlib
+import json
+import time
+
+import discord
+
+
+def content_hash(embeds):
+    """Return a stable hash of a digest's rendered embeds."""
+    payload = json.dumps([embed.to_dict() for embed in embeds], sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class Digest:
+    """A user's rendered daily homework embeds.
+
+    ``snapshot`` holds the assignments the digest tells the user about, to be
+    saved once it is delivered.
+    """
+
+    __slots__ = ("user_id", "embeds", "content_hash", "built_at", "snapshot")
+
+    def __init__(self, user_id, embeds, built_at=None, snapshot=None):
+        self.user_id = str(user_id)
+        self.embeds = embeds
+        self.content_hash = content_hash(embeds)
+        self.built_at = built_at or time.time()
+        self.snapshot = snapshot
+
+
+class DigestStore:
+    """Holds each user's latest prefetched digest until it is delivered or goes stale."""
+
+    def __init__(self, max_age):
+        self.max_age = max_age
+        self._digests = {}
+
+    def __len__(self):
+        return len(self._digests)
+
+    def put(self, digest):
+        """Store a user's digest, replacing any older one."""
+        self._digests[digest.user_id] = digest
+
+    def take(self, user_id):
+        """Remove and return a user's digest if it is still fresh, otherwise None."""
+        digest = self._digests.pop(str(user_id), None)
+        if digest is None or time.time() - digest.built_at > self.max_age:
+            return None
+        return digest
+
+    def discard_stale(self):
+        """Drop digests that were never delivered."""
+        cutoff = time.time() - self.max_age
+        for user_id in [user_id for user_id, digest in self._digests.items() if digest.built_at < cutoff]:
+            del self._digests[user_id]
+
+
+def dump_embeds(embeds):
+    """Serialize a digest's embeds for storage."""
+    return json.dumps([embed.to_dict() for embed in embeds])
+
+
+def load_embeds(payload):
+    """Rebuild embeds serialized with dump_embeds."""
+    return [discord.Embed.from_dict(data) for data in json.loads(payload)]
@@ -1,10 +1,23 @@
 import discord
 from discord import Embed, Color
 import datetime as dt
-from aiohttp import ClientSession
 import asyncio
 from datetime import datetime, timedelta
 import pytz
+from urllib.parse import urlsplit
+
+from utils.cache import TTLCache
+from utils.canvas import CanvasClient, CanvasError
+from utils.config import (
+    COURSE_CACHE_SIZE,
+    COURSE_CACHE_TTL,
+    HOMEWORK_FETCH_MODE,
+    HOMEWORK_FETCH_MODE_OVERRIDES,
+    PLANNER_OVERDUE_LOOKBACK_DAYS,
+)
+
+# Course lists keyed by (user_id, starred); enrolments rarely change within a day
+course_cache = TTLCache(COURSE_CACHE_SIZE, COURSE_CACHE_TTL)
 
 async def get_token(user_id, db):
     """Get the Canvas API token for a user."""
@@ -12,16 +25,594 @@ async def get_token(user_id, db):
         return None
     return db[str(user_id)].get("id")
 
-async def get_homework(user_id, course_list, headers, endpoint, days_to_look_ahead=7, include_overdue=True):
-    """Fetch homework assignments from Canvas API.
+async def get_courses(client, endpoint, headers, starred=False, user_id=None, refresh=False):
+    """Fetch the user's active Canvas courses.
+    
+    When a user_id is given the list is served from the course cache, unless
+    refresh is set or the cached list has expired.
     
     Args:
-        user_id: Discord user ID
-        course_list: List of Canvas courses
-        headers: Authorization headers for Canvas API
+        client: Shared CanvasClient
         endpoint: Canvas API endpoint
+        headers: Authorization headers for Canvas API
+        starred: Whether to only return the user's favorite courses (default: False)
+        user_id: Discord user ID used as the cache key (default: don't cache)
+        refresh: Whether to bypass the cached list (default: False)
+    
+    Returns:
+        The list of courses, or None if Canvas returned an error.
+    """
+    cache_key = (str(user_id), bool(starred))
+    if user_id is not None and not refresh:
+        course_list = course_cache.get(cache_key)
+        if course_list is not None:
+            return course_list
+    
+    if starred:
+        url = f"{endpoint}/users/self/favorites/courses"
+    else:
+        url = f"{endpoint}/courses"
+    
+    course_list = await client.get_all(url, headers=headers, params={"enrollment_state": "active"})
+    if user_id is not None and course_list is not None:
+        course_cache.set(cache_key, course_list)
+    return course_list
+
+def invalidate_courses(user_id):
+    """Drop a user's cached course lists, e.g. after their settings or token change."""
+    course_cache.pop((str(user_id), True))
+    course_cache.pop((str(user_id), False))
+
+# Canvas assignment buckets fetched for each course
+BUCKETS = ("overdue", "future", "undated")
+
+# Planner item types that correspond to assignments
+PLANNER_ASSIGNMENT_TYPES = {"assignment", "quiz", "discussion_topic"}
+
+# Assignments requested per course in a GraphQL query
+GRAPHQL_PAGE_SIZE = 100
+
+# Statuses showing an institution has no GraphQL endpoint
+GRAPHQL_UNSUPPORTED_STATUSES = {404, 405, 501}
+
+# GraphQL error codes showing the institution's schema doesn't support the query
+GRAPHQL_SCHEMA_ERROR_CODES = {"undefinedField", "undefinedType", "argumentNotAccepted", "missingRequiredArguments"}
+
+# How long a host whose GraphQL endpoint is unsupported uses the REST fallback, in seconds
+GRAPHQL_UNAVAILABLE_TTL = 6 * 3600
+
+# Canvas hosts whose GraphQL endpoint is unsupported, which use the REST fallback until the entry expires
+graphql_unavailable_hosts = TTLCache(1000, GRAPHQL_UNAVAILABLE_TTL)
+
+class GraphQLSchemaError(CanvasError):
+    """Raised when an institution's GraphQL schema rejects the homework query."""
+
+# Submission types that never make an assignment overdue
+NO_SUBMISSION_TYPES = {"none", "on_paper", "not_graded"}
+
+# Maximum number of dated assignments listed per course to stay under Discord's 1024 character field limit
+MAX_ASSIGNMENTS_PER_FIELD = 5
+
+# Discord's limit on the length of an embed field value
+MAX_FIELD_LENGTH = 1024
+
+def bucket_is_full(bucket, assignments, cutoff_date=None):
+    """Whether a bucket already holds every assignment its embed field can show.
+    
+    Assignments are streamed in due date order, so once the latest future
+    assignment is past the cutoff nothing after it will be rendered either.
+    """
+    if bucket == "undated":
+        # One line per name; once they overflow the field the rest are cut off anyway
+        return sum(len(assignment['name']) + 1 for assignment in assignments) > MAX_FIELD_LENGTH
+    
+    dated = [assignment for assignment in assignments if assignment.get('due_at')]
+    if bucket == "future" and cutoff_date is not None and dated:
+        try:
+            if parse_due_date(dated[-1]['due_at']) > cutoff_date:
+                return True
+        except (ValueError, TypeError):
+            pass
+    return len(dated) >= MAX_ASSIGNMENTS_PER_FIELD
+
+async def fetch_bucket(client, endpoint, headers, course, bucket, cutoff_date=None, complete=False):
+    """Fetch one bucket of a course's assignments.
+    
+    Pages are streamed and the fetch stops as soon as the bucket is full,
+    unless complete is set.
+    
+    Returns:
+        The list of assignments, or None if Canvas returned an error.
+    """
+    params = {"bucket": bucket}
+    if bucket != "undated":
+        params["order_by"] = "due_at"
+    
+    assignments = []
+    pages = client.paginate(f"{endpoint}/courses/{course['id']}/assignments", headers=headers, params=params)
+    try:
+        async for assignment in pages:
+            assignments.append(assignment)
+            if not complete and bucket_is_full(bucket, assignments, cutoff_date):
+                break
+    except CanvasError:
+        return None
+    finally:
+        await pages.aclose()
+    return assignments
+
+def is_submitted(assignment):
+    """Whether the user has submitted (or been excused from) an assignment."""
+    submission = assignment.get('submission') or {}
+    if submission.get('submitted_at') or submission.get('excused'):
+        return True
+    return submission.get('workflow_state') in ("submitted", "graded", "pending_review")
+
+def expects_submission(assignment):
+    """Whether an assignment takes a submission and can therefore be overdue."""
+    submission_types = set(assignment.get('submission_types') or [])
+    return not submission_types or not submission_types <= NO_SUBMISSION_TYPES
+
+def assignment_bucket(assignment, now):
+    """Return the Canvas bucket an assignment falls into, or None if it is in none of them.
+    
+    Mirrors the server-side buckets: overdue assignments are past due and still
+    awaiting a submission, future assignments are due after now and undated
+    assignments have no due date.
+    """
+    if not assignment.get('due_at'):
+        return "undated"
+    
+    try:
+        due_date = parse_due_date(assignment['due_at'])
+    except (ValueError, TypeError):
+        return None
+    
+    if due_date > now:
+        return "future"
+    if expects_submission(assignment) and not is_submitted(assignment):
+        return "overdue"
+    return None
+
+def bucket_assignments(assignments, now):
+    """Split assignments into Canvas's overdue, future and undated buckets."""
+    buckets = {"overdue": [], "future": [], "undated": []}
+    for assignment in assignments:
+        bucket = assignment_bucket(assignment, now)
+        if bucket:
+            buckets[bucket].append(assignment)
+    return buckets
+
+async def fetch_course_assignments(client, endpoint, headers, course, now, cutoff_date=None, include_overdue=True, complete=False):
+    """Fetch a course's assignments, with the user's submission, in a single listing.
+    
+    Canvas has no due date filter on this endpoint, so the listing is streamed
+    and bucketed locally. It is sorted by due date with undated assignments
+    last, so a bucket stops growing once the listing has moved past it. Unless
+    complete is set, the listing stops once the dated buckets are full or passed;
+    if it hasn't reached the undated assignments by then, they are fetched from
+    the undated bucket instead of paging through the rest of the course.
+    
+    Returns:
+        A dict mapping each bucket name to its assignments, or None if Canvas returned an error.
+    """
+    buckets = {"overdue": [], "future": [], "undated": []}
+    wanted = [bucket for bucket in BUCKETS if include_overdue or bucket != "overdue"]
+    dated = [bucket for bucket in wanted if bucket != "undated"]
+    
+    # Index in BUCKETS of the furthest bucket the listing has reached
+    position = 0
+    fetch_undated = False
+    params = {"order_by": "due_at", "include[]": "submission"}
+    pages = client.paginate(f"{endpoint}/courses/{course['id']}/assignments", headers=headers, params=params)
+    try:
+        async for assignment in pages:
+            bucket = assignment_bucket(assignment, now)
+            if not assignment.get('due_at'):
+                position = BUCKETS.index("undated")
+            elif bucket == "future":
+                position = max(position, BUCKETS.index("future"))
+            if bucket in wanted:
+                buckets[bucket].append(assignment)
+            if complete:
+                continue
+            
+            if all(BUCKETS.index(name) < position or bucket_is_full(name, buckets[name], cutoff_date) for name in dated):
+                if position < BUCKETS.index("undated"):
+                    fetch_undated = True
+                    break
+                if bucket_is_full("undated", buckets["undated"]):
+                    break
+    except CanvasError:
+        return None
+    finally:
+        await pages.aclose()
+    
+    if fetch_undated:
+        buckets["undated"] = await fetch_bucket(client, endpoint, headers, course, "undated")
+        if buckets["undated"] is None:
+            return None
+    
+    if not include_overdue:
+        buckets["overdue"] = None
+    return buckets
+
+def planner_item_to_assignment(item):
+    """Convert a planner item into the assignment shape used for bucketing and rendering.
+    
+    Returns:
+        The assignment dict, or None if the item is not a gradable assignment.
+    """
+    if item.get('plannable_type') not in PLANNER_ASSIGNMENT_TYPES:
+        return None
+    
+    # Items without a submission (e.g. ungraded discussions) are not assignments
+    submissions = item.get('submissions')
+    if not submissions:
+        return None
+    
+    plannable = item.get('plannable') or {}
+    return {
+        # Quizzes and discussions are planned by their own id but belong to an assignment
+        'id': plannable.get('assignment_id') or item.get('plannable_id'),
+        'name': plannable.get('title') or plannable.get('name', ''),
+        'due_at': plannable.get('due_at') or item.get('plannable_date'),
+        'submission': {
+            'workflow_state': "submitted" if submissions.get('submitted') else "unsubmitted",
+            'excused': submissions.get('excused', False),
+        },
+    }
+
+async def fetch_planner_homework(client, course_list, headers, endpoint, now, cutoff_date=None, include_overdue=True, complete=False):
+    """Fetch every course's dated assignments from the user's planner in one paginated listing.
+    
+    The planner only returns dated items, so undated assignments are still
+    fetched per course, concurrently with the planner listing.
+    
+    Raises:
+        CanvasError: If Canvas returned an error for the planner listing.
+    """
+    if cutoff_date is None:
+        cutoff_date = now + timedelta(days=7)
+    start_date = now - timedelta(days=PLANNER_OVERDUE_LOOKBACK_DAYS) if include_overdue else now
+    
+    course_homework = {}
+    for course in course_list:
+        course_homework[str(course['id'])] = {
+            "course": course,
+            "overdue": [] if include_overdue else None,
+            "future": [],
+            "undated": None,
+        }
+    
+    async def stream_planner():
+        async for course_id, assignment in fetch_planner_assignments(client, headers, endpoint, start_date, cutoff_date):
+            entry = course_homework.get(str(course_id))
+            if entry is None:
+                continue
+            bucket = assignment_bucket(assignment, now)
+            if bucket in ("overdue", "future") and entry[bucket] is not None:
+                entry[bucket].append(assignment)
+    
+    undated_results = await asyncio.gather(
+        stream_planner(),
+        *(fetch_bucket(client, endpoint, headers, course, "undated", complete=complete) for course in course_list)
+    )
+    for course, undated in zip(course_list, undated_results[1:]):
+        course_homework[str(course['id'])]["undated"] = undated
+    
+    return list(course_homework.values())
+
+def fetch_mode_for(endpoint):
+    """Return the fetch mode configured for a user's Canvas endpoint."""
+    host = urlsplit(endpoint).netloc
+    mode = HOMEWORK_FETCH_MODE_OVERRIDES.get(host, HOMEWORK_FETCH_MODE)
+    if mode == "graphql" and graphql_unavailable_hosts.get(host):
+        return "single"
+    return mode
+
+def graphql_url(endpoint):
+    """Return the GraphQL URL for a REST endpoint such as https://school.instructure.com/api/v1."""
+    base = endpoint.rstrip('/')
+    if base.endswith("/api/v1"):
+        base = base[:-len("/api/v1")]
+    return f"{base}/api/graphql"
+
+def build_homework_query(course_list):
+    """Build one GraphQL query for every course's assignments, asking only for the fields the embeds use."""
+    course_queries = []
+    for index, course in enumerate(course_list):
+        course_queries.append(f'''
+  c{index}: course(id: "{int(course['id'])}") {{
+    assignmentsConnection(first: {GRAPHQL_PAGE_SIZE}) {{
+      pageInfo {{ hasNextPage }}
+      nodes {{
+        _id
+        name
+        dueAt
+        submissionTypes
+        submissionsConnection(first: 1) {{ nodes {{ submittedAt excused }} }}
+      }}
+    }}
+  }}''')
+    return "query Homework {" + "".join(course_queries) + "\n}"
+
+def graphql_node_to_assignment(node):
+    """Convert a GraphQL assignment node into the assignment shape used for bucketing and rendering."""
+    submissions = ((node.get('submissionsConnection') or {}).get('nodes')) or [{}]
+    return {
+        'id': node.get('_id'),
+        'name': node.get('name') or "",
+        'due_at': node.get('dueAt'),
+        'submission_types': [submission_type.lower() for submission_type in node.get('submissionTypes') or []],
+        'submission': {
+            'submitted_at': submissions[0].get('submittedAt'),
+            'excused': submissions[0].get('excused'),
+        },
+    }
+
+async def fetch_graphql_homework(client, course_list, headers, endpoint, now, cutoff_date=None, include_overdue=True, complete=False):
+    """Fetch every course's assignments in a single GraphQL query.
+    
+    Courses with more assignments than fit in one GraphQL page, and courses
+    the query returned errors for, are fetched through the REST single-pass
+    path instead.
+    
+    Raises:
+        GraphQLSchemaError: If the institution's schema doesn't support the query.
+        CanvasError: If the GraphQL request failed.
+    """
+    if not course_list:
+        return []
+    
+    url = graphql_url(endpoint)
+    response = await client.post(url, headers=headers, json={"query": build_homework_query(course_list)})
+    if isinstance(response.data, dict) and any(
+        (error.get('extensions') or {}).get('code') in GRAPHQL_SCHEMA_ERROR_CODES
+        for error in response.data.get('errors') or []
+    ):
+        raise GraphQLSchemaError(response.status, url)
+    if not response.ok or not isinstance(response.data, dict) or not response.data.get('data'):
+        raise CanvasError(response.status, url)
+    
+    # Errors for some courses still leave the data of the courses that resolved
+    data = response.data['data']
+    course_homework = []
+    overflow = []
+    for index, course in enumerate(course_list):
+        entry = {"course": course, "overdue": None, "future": None, "undated": None}
+        connection = (data.get(f"c{index}") or {}).get('assignmentsConnection')
+        if connection is None or (connection.get('pageInfo') or {}).get('hasNextPage'):
+            overflow.append(entry)
+        else:
+            assignments = [graphql_node_to_assignment(node) for node in connection.get('nodes') or []]
+            assignments.sort(key=lambda assignment: assignment['due_at'] or "")
+            entry.update(bucket_assignments(assignments, now))
+            if not include_overdue:
+                entry["overdue"] = None
+        course_homework.append(entry)
+    
+    results = await asyncio.gather(*(
+        fetch_course_assignments(client, endpoint, headers, entry["course"], now, cutoff_date, include_overdue, complete)
+        for entry in overflow
+    ))
+    for entry, buckets in zip(overflow, results):
+        if buckets is not None:
+            entry.update(buckets)
+    
+    return course_homework
+
+async def fetch_planner_assignments(client, headers, endpoint, start_date, end_date):
+    """Stream the user's dated planner assignments in a window.
+    
+    Raises:
+        CanvasError: If Canvas returned an error for the planner listing.
+    """
+    params = {"start_date": start_date.isoformat(), "end_date": end_date.isoformat()}
+    async for item in client.paginate(f"{endpoint}/planner/items", headers=headers, params=params):
+        assignment = planner_item_to_assignment(item)
+        if assignment is not None:
+            yield item.get('course_id'), assignment
+
+async def fetch_catalogue_homework(client, catalogue, course_list, headers, endpoint, now, cutoff_date=None, include_overdue=True):
+    """Fetch the planner backend's buckets, using the shared catalogue to skip needless undated requests.
+    
+    The user's planner listing (one paginated request across all courses)
+    supplies their dated assignments, as in the planner backend. The catalogue
+    supplies every course's assignment definitions once per run, so the user's
+    own undated bucket is only requested for courses that have undated
+    definitions; a per-user due date override can still give one of them a
+    date, which only the user's own listing knows about.
+    
+    Raises:
+        CanvasError: If Canvas returned an error for the planner listing.
+    """
+    if cutoff_date is None:
+        cutoff_date = now + timedelta(days=7)
+    start_date = now - timedelta(days=PLANNER_OVERDUE_LOOKBACK_DAYS) if include_overdue else now
+    
+    overlay = {str(course['id']): [] for course in course_list}
+    
+    async def stream_planner():
+        async for course_id, assignment in fetch_planner_assignments(client, headers, endpoint, start_date, cutoff_date):
+            if str(course_id) in overlay:
+                overlay[str(course_id)].append(assignment)
+    
+    async def fetch_undated(course):
+        definitions = await catalogue.get(client, endpoint, headers, course)
+        if definitions is not None and all(definition['due_at'] for definition in definitions):
+            return []
+        return await fetch_bucket(client, endpoint, headers, course, "undated")
+    
+    results = await asyncio.gather(stream_planner(), *(fetch_undated(course) for course in course_list))
+    
+    course_homework = []
+    for course, undated in zip(course_list, results[1:]):
+        entry = {"course": course, "undated": undated}
+        buckets = bucket_assignments(overlay[str(course['id'])], now)
+        entry["overdue"] = buckets["overdue"] if include_overdue else None
+        entry["future"] = buckets["future"]
+        course_homework.append(entry)
+    return course_homework
+
+async def fetch_homework(client, course_list, headers, endpoint, include_overdue=True, mode=None, now=None, cutoff_date=None, complete=False, catalogue=None):
+    """Fetch every course's assignment buckets concurrently.
+    
+    Requests are bounded by the client's per-token and per-host concurrency limits.
+    
+    Args:
+        mode: "buckets" to request each bucket from Canvas, "single" to fetch each
+            course once and bucket locally, or "planner" to fetch every course's dated
+            assignments from the user's planner, or "graphql" to fetch every course in
+            one GraphQL query (default: the mode configured for the endpoint)
+        now: Current time used for local bucketing (default: now in UTC)
+        cutoff_date: Latest due date that will be rendered, used to stop paging early
+        complete: Fetch every assignment instead of stopping once the embeds are full
+        catalogue: Shared AssignmentCatalogue for the current run; in planner mode it
+            spares the undated requests for courses without undated assignments
+    
+    Returns:
+        A list with one dict per course, in course order, mapping 'course' to the
+        course and each bucket name to its assignments (None if the fetch failed).
+    """
+    mode = mode or fetch_mode_for(endpoint)
+    if now is None:
+        now = datetime.now(pytz.UTC)
+    
+    # The catalogue only stands in for the planner backend's undated requests
+    if catalogue is not None and mode == "planner" and not complete:
+        try:
+            return await fetch_catalogue_homework(client, catalogue, course_list, headers, endpoint, now, cutoff_date, include_overdue)
+        except CanvasError:
+            # Planner unavailable for this user or institution, fall back to per-course requests
+            mode = "single"
+    
+    if mode == "graphql":
+        try:
+            return await fetch_graphql_homework(client, course_list, headers, endpoint, now, cutoff_date, include_overdue, complete)
+        except CanvasError as e:
+            # A missing endpoint or a schema that rejects the query means this institution has no
+            # usable GraphQL, so use REST for a while; other errors only fall back for this call
+            if isinstance(e, GraphQLSchemaError) or e.status in GRAPHQL_UNSUPPORTED_STATUSES:
+                graphql_unavailable_hosts.set(urlsplit(endpoint).netloc, True)
+            mode = "single"
+    
+    if mode == "planner":
+        try:
+            return await fetch_planner_homework(client, course_list, headers, endpoint, now, cutoff_date, include_overdue, complete)
+        except CanvasError:
+            # Planner unavailable for this user or institution, fall back to per-course requests
+            mode = "single"
+    
+    if mode == "single":
+        results = await asyncio.gather(*(
+            fetch_course_assignments(client, endpoint, headers, course, now, cutoff_date, include_overdue, complete)
+            for course in course_list
+        ))
+        
+        course_homework = []
+        for course, buckets in zip(course_list, results):
+            entry = {"course": course, "overdue": None, "future": None, "undated": None}
+            if buckets is not None:
+                entry.update(buckets)
+            course_homework.append(entry)
+        return course_homework
+    
+    buckets = [bucket for bucket in BUCKETS if include_overdue or bucket != "overdue"]
+    results = await asyncio.gather(*(
+        fetch_bucket(client, endpoint, headers, course, bucket, cutoff_date, complete)
+        for course in course_list
+        for bucket in buckets
+    ))
+    
+    course_homework = []
+    for index, course in enumerate(course_list):
+        entry = {"course": course, "overdue": None, "future": None, "undated": None}
+        for offset, bucket in enumerate(buckets):
+            entry[bucket] = results[index * len(buckets) + offset]
+        course_homework.append(entry)
+    return course_homework
+
+def truncate_name(name):
+    """Shorten an assignment name so it fits on one line of an embed field."""
+    if len(name) > 40:
+        name = name[:37] + "..."
+    return name
+
+def parse_due_date(due_at):
+    """Parse a Canvas due_at timestamp into a timezone-aware datetime."""
+    return datetime.fromisoformat(due_at.replace('Z', '+00:00'))
+
+def format_overdue_field(assignments):
+    """Build the embed field text for a course's overdue assignments."""
+    field_content = ""
+    
+    # Track the field content length to avoid exceeding Discord's limit
+    assignment_count = 0
+    
+    for assignment in assignments:
+        if assignment.get('due_at') and assignment_count < MAX_ASSIGNMENTS_PER_FIELD:
+            try:
+                # Parse the due date string to a timezone-aware datetime
+                due_date = parse_due_date(assignment['due_at'])
+                # Format nicely but keep it concise
+                formatted_date = due_date.strftime('%b %d, %Y')
+                name = truncate_name(assignment['name'])
+                
+                field_content += f"\n• **{name}** - Due: {formatted_date}"
+                assignment_count += 1
+            except (ValueError, TypeError):
+                # If parsing fails, just use the raw string
+                field_content += f"\n• **{assignment['name']}**\n  Due: {assignment.get('due_at', 'unknown date')}"
+    
+    return field_content
+
+def format_due_soon_field(assignments, cutoff_date):
+    """Build the embed field text for a course's assignments due before the cutoff date."""
+    field_content = ""
+    
+    # Track assignment count to avoid exceeding Discord's field length limit
+    assignment_count = 0
+    
+    for assignment in assignments:
+        if assignment.get('due_at') and assignment_count < MAX_ASSIGNMENTS_PER_FIELD:
+            try:
+                due_date = parse_due_date(assignment['due_at'])
+                
+                # Only include assignments due within the specified days
+                if due_date <= cutoff_date:
+                    name = truncate_name(assignment['name'])
+                    
+                    # Format the due date concisely
+                    formatted_date = due_date.strftime('%b %d, %Y')
+                    field_content += f"\n• **{name}** - Due: {formatted_date}"
+                    assignment_count += 1
+            except (ValueError, TypeError):
+                continue
+    
+    return field_content
+
+def format_undated_field(assignments):
+    """Build the embed field text for a course's undated assignments."""
+    field_content = ""
+    
+    for assignment in assignments:
+        line = f"\n{assignment['name']}"
+        # Stop before exceeding Discord's field length limit
+        if len(field_content) + len(line) > MAX_FIELD_LENGTH:
+            break
+        field_content += line
+    
+    return field_content
+
+def render_homework(course_homework, days_to_look_ahead=7, include_overdue=True, now=None):
+    """Render fetched course homework into the due soon, overdue and undated embeds.
+    
+    Args:
+        course_homework: Per-course buckets as returned by fetch_homework
         days_to_look_ahead: Number of days to look ahead for assignments (default: 7)
         include_overdue: Whether to include overdue assignments (default: True)
+        now: Current time used for the due soon cutoff (default: now in UTC)
     """
     # Create embeds for different types of assignments
     overdue_embed = Embed(title=f"Overdue Assignments", color=Color.red())
@@ -34,124 +625,91 @@ async def get_homework(user_id, course_list, headers, endpoint, days_to_look_ahe
     undated_embed.description = "These assignments have no due date set."
     
     # Get current time in UTC (timezone-aware)
-    now = datetime.now(pytz.UTC)
+    if now is None:
+        now = datetime.now(pytz.UTC)
     
-    # Process each course
-    for course in course_list:
-        # Fetch overdue assignments
-        async with ClientSession() as session:
-            params = {"bucket": "overdue", "order_by": "due_at"}
-            async with session.get(
-                url=f"{endpoint}/courses/{course['id']}/assignments", 
-                params=params, 
-                headers=headers
-            ) as response:
-                if response.status == 200:
-                    assignments = await response.json()
-                    field_content = ""
-                    
-                    # Track the field content length to avoid exceeding Discord's limit
-                    assignment_count = 0
-                    max_assignments = 5  # Adjust as needed to stay under 1024 chars
-                    
-                    for assignment in assignments:
-                        if assignment.get('due_at') and assignment_count < max_assignments:
-                            try:
-                                # Parse the due date string to a timezone-aware datetime
-                                due_date_str = assignment['due_at']
-                                due_date = datetime.fromisoformat(due_date_str.replace('Z', '+00:00'))
-                                # Format nicely but keep it concise
-                                formatted_date = due_date.strftime('%b %d, %Y')
-                                # Truncate assignment name if too long
-                                name = assignment['name']
-                                if len(name) > 40:
-                                    name = name[:37] + "..."
-                                
-                                field_content += f"\n• **{name}** - Due: {formatted_date}"  
-                                assignment_count += 1
-                            except (ValueError, TypeError):
-                                # If parsing fails, just use the raw string
-                                field_content += f"\n• **{assignment['name']}**\n  Due: {assignment.get('due_at', 'unknown date')}"
-                    
-                    if field_content:
-                        overdue_embed.add_field(
-                            name=f"Overdue For {course['name']}:",
-                            value=field_content,
-                            inline=False
-                        )
+    # Calculate the cutoff date for assignments
+    cutoff_date = now + timedelta(days=days_to_look_ahead)
+    
+    # Add each course's fields in course order
+    for entry in course_homework:
+        course = entry["course"]
         
-        # Fetch upcoming assignments
-        async with ClientSession() as session:
-            params = {"bucket": "future", "order_by": "due_at"}
-            async with session.get(
-                url=f"{endpoint}/courses/{course['id']}/assignments", 
-                params=params, 
-                headers=headers
-            ) as response:
-                if response.status == 200:
-                    assignments = await response.json()
-                    field_content = ""
-                    
-                    # Calculate the cutoff date for assignments
-                    # Use the now variable defined at the beginning of the function
-                    cutoff_date = now + timedelta(days=days_to_look_ahead)
-                    
-                    # Track assignment count to avoid exceeding Discord's field length limit
-                    assignment_count = 0
-                    max_assignments = 5  # Adjust as needed to stay under 1024 chars
-                    
-                    for assignment in assignments:
-                        if assignment.get('due_at') and assignment_count < max_assignments:
-                            try:
-                                # Parse the due date
-                                due_date_str = assignment['due_at']
-                                due_date = datetime.fromisoformat(due_date_str.replace('Z', '+00:00'))
-                                
-                                # Only include assignments due within the specified days
-                                if due_date <= cutoff_date:
-                                    # Truncate assignment name if too long
-                                    name = assignment['name']
-                                    if len(name) > 40:
-                                        name = name[:37] + "..."
-                                    
-                                    # Format the due date concisely
-                                    formatted_date = due_date.strftime('%b %d, %Y')
-                                    field_content += f"\n• **{name}** - Due: {formatted_date}"
-                                    assignment_count += 1
-                            except (ValueError, TypeError):
-                                continue
-                    
-                    if field_content:
-                        due_soon_embed.add_field(
-                            name=f"Due Soon For {course['name']}:",
-                            value=field_content,
-                            inline=False
-                        )
+        if entry["overdue"]:
+            field_content = format_overdue_field(entry["overdue"])
+            if field_content:
+                overdue_embed.add_field(
+                    name=f"Overdue For {course['name']}:",
+                    value=field_content,
+                    inline=False
+                )
         
-        # Fetch undated assignments
-        async with ClientSession() as session:
-            params = {"bucket": "undated"}
-            async with session.get(
-                url=f"{endpoint}/courses/{course['id']}/assignments", 
-                params=params, 
-                headers=headers
-            ) as response:
-                if response.status == 200:
-                    assignments = await response.json()
-                    field_content = ""
-                    
-                    for assignment in assignments:
-                        field_content += f"\n{assignment['name']}"
-                    
-                    if field_content:
-                        undated_embed.add_field(
-                            name=f"Undated For {course['name']}:",
-                            value=field_content,
-                            inline=False
-                        )
+        if entry["future"]:
+            field_content = format_due_soon_field(entry["future"], cutoff_date)
+            if field_content:
+                due_soon_embed.add_field(
+                    name=f"Due Soon For {course['name']}:",
+                    value=field_content,
+                    inline=False
+                )
+        
+        if entry["undated"]:
+            field_content = format_undated_field(entry["undated"])
+            if field_content:
+                undated_embed.add_field(
+                    name=f"Undated For {course['name']}:",
+                    value=field_content,
+                    inline=False
+                )
     
     # Only return overdue embed if include_overdue is True
     if include_overdue:
         return [due_soon_embed, overdue_embed, undated_embed]
     else:
         return [due_soon_embed, Embed(title=""), undated_embed]  # Empty embed as placeholder
+
+def mark_staleness(embeds, synced_at, now):
+    """Note on each embed how long ago its assignments were synced from Canvas."""
+    minutes = max(int((now.timestamp() - synced_at) // 60), 0)
+    footer = "Synced from Canvas just now" if minutes == 0 else f"Synced from Canvas {minutes} minute{'s' if minutes != 1 else ''} ago"
+    for embed in embeds:
+        # Leave the empty placeholder embed empty so it is still skipped when sending
+        if embed.title:
+            embed.set_footer(text=footer)
+
+async def get_homework(user_id, course_list, headers, endpoint, days_to_look_ahead=7, include_overdue=True, client=None, mode=None, catalogue=None, replica=None):
+    """Fetch homework assignments from Canvas API.
+    
+    All courses and buckets are fetched concurrently; the embeds still list
+    courses in course_list order.
+    
+    Args:
+        user_id: Discord user ID
+        course_list: List of Canvas courses
+        headers: Authorization headers for Canvas API
+        endpoint: Canvas API endpoint
+        days_to_look_ahead: Number of days to look ahead for assignments (default: 7)
+        include_overdue: Whether to include overdue assignments (default: True)
+        client: Shared CanvasClient (default: a temporary client for this call)
+        mode: "buckets", "single", "planner" or "graphql" fetch mode (default: the mode configured for the endpoint)
+        catalogue: Shared AssignmentCatalogue for the current daily run (default: None)
+        replica: AsyncReplicaStore to answer from without contacting Canvas; Canvas is only
+            used if the replica doesn't cover the query (default: always use Canvas)
+    """
+    now = datetime.now(pytz.UTC)
+    cutoff_date = now + timedelta(days=days_to_look_ahead)
+    
+    if replica is not None:
+        result = await replica.homework(user_id, endpoint, course_list, now, cutoff_date, include_overdue)
+        if result is not None:
+            course_homework, synced_at = result
+            embeds = render_homework(course_homework, days_to_look_ahead, include_overdue, now)
+            mark_staleness(embeds, synced_at, now)
+            return embeds
+    
+    if client is None:
+        async with CanvasClient() as temp_client:
+            return await get_homework(user_id, course_list, headers, endpoint, days_to_look_ahead, include_overdue, temp_client, mode, catalogue)
+    
+    course_homework = await fetch_homework(client, course_list, headers, endpoint, include_overdue, mode, now, cutoff_date, catalogue=catalogue)
+    return render_homework(course_homework, days_to_look_ahead, include_overdue, now)
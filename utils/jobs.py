@@ -0,0 +1,289 @@
+"""Persistent record of the daily homework runs so an interrupted run can be resumed."""
+import logging
+import sqlite3
+import time
+
+from utils.config import DAILY_MAX_ATTEMPTS, DB_BUSY_TIMEOUT_MS
+
+logger = logging.getLogger('canvasbot.jobs')
+
+# Job statuses
+PENDING = "pending"
+FETCHED = "fetched"
+DELIVERED = "delivered"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+class DailyJobStore:
+    """Daily runs and the per-user jobs in each, stored in the bot's SQLite database.
+
+    A run is created for every prefetch slot with one pending job per user.
+    Jobs move to fetched once their digest is stored, then to delivered (or
+    skipped, when the user turned out to be ineligible). A failed job keeps
+    its attempt count and stays open until it reaches ``max_attempts``.
+    Delivered and skipped jobs are never picked up again, so resuming a run
+    does not send duplicates.
+    """
+
+    def __init__(self, db_file, max_attempts=DAILY_MAX_ATTEMPTS):
+        self.max_attempts = max_attempts
+        # Queries run on the database thread through AsyncDailyJobStore, not the thread that opens the store
+        self.conn = sqlite3.connect(db_file, check_same_thread=False, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+        self.conn.row_factory = sqlite3.Row
+        self.create_tables()
+
+    def create_tables(self):
+        """Create the job tables if they don't exist."""
+        with self.conn:
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS daily_runs (
+                    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    slot REAL NOT NULL,
+                    created_at REAL NOT NULL,
+                    finished_at REAL DEFAULT NULL
+                )
+            ''')
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS daily_jobs (
+                    run_id INTEGER NOT NULL REFERENCES daily_runs(run_id),
+                    user_id TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    digest TEXT DEFAULT NULL,
+                    content_hash TEXT DEFAULT NULL,
+                    fetched_at REAL DEFAULT NULL,
+                    error TEXT DEFAULT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (run_id, user_id)
+                )
+            ''')
+            self.conn.execute("CREATE INDEX IF NOT EXISTS daily_jobs_user ON daily_jobs (user_id, status)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS daily_runs_open ON daily_runs (finished_at, slot)")
+
+    def close(self):
+        """Close the database connection."""
+        self.conn.close()
+
+    def _open_condition(self):
+        return (
+            f"(j.status IN ('{PENDING}', '{FETCHED}') OR (j.status = '{FAILED}' AND j.attempts < ?))",
+            (self.max_attempts,)
+        )
+
+    def create_run(self, slot, user_ids):
+        """Record a new run for a delivery slot with a pending job per user.
+
+        Args:
+            slot: Unix timestamp the run's digests are due to be delivered at
+            user_ids: The users in the run
+
+        Returns:
+            The new run's id.
+        """
+        now = time.time()
+        with self.conn:
+            cursor = self.conn.execute("INSERT INTO daily_runs (slot, created_at) VALUES (?, ?)", (slot, now))
+            run_id = cursor.lastrowid
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO daily_jobs (run_id, user_id, status, updated_at) VALUES (?, ?, ?, ?)",
+                [(run_id, str(user_id), PENDING, now) for user_id in user_ids]
+            )
+        return run_id
+
+    def open_job(self, user_id, since):
+        """Return a user's latest open job in an unfinished run with a slot after ``since``, or None."""
+        condition, params = self._open_condition()
+        row = self.conn.execute(f'''
+            SELECT j.run_id, j.user_id, j.status, j.attempts, j.digest, j.fetched_at, r.slot
+            FROM daily_jobs j JOIN daily_runs r ON r.run_id = j.run_id
+            WHERE j.user_id = ? AND r.finished_at IS NULL AND r.slot >= ? AND {condition}
+            ORDER BY r.slot DESC LIMIT 1
+        ''', (str(user_id), since, *params)).fetchone()
+        return dict(row) if row else None
+
+    def has_finished_job(self, user_id, since):
+        """Whether a user's job in a run with a slot after ``since`` was delivered, skipped or given up."""
+        condition, params = self._open_condition()
+        row = self.conn.execute(f'''
+            SELECT 1 FROM daily_jobs j JOIN daily_runs r ON r.run_id = j.run_id
+            WHERE j.user_id = ? AND r.slot >= ? AND NOT {condition}
+            LIMIT 1
+        ''', (str(user_id), since, *params)).fetchone()
+        return row is not None
+
+    def lookup(self, user_ids, since):
+        """Sort users into those with an open job and those with no job since ``since``.
+
+        Each user's open job is their latest one in an unfinished run, as with
+        ``open_job``. Users whose job was delivered, skipped or given up are in
+        neither list.
+
+        Returns:
+            A (jobs, missing) tuple of open job dicts and user ids.
+        """
+        user_ids = list(dict.fromkeys(str(user_id) for user_id in user_ids))
+        condition, params = self._open_condition()
+        open_jobs = {}
+        finished = set()
+        # Stay well under SQLite's limit on query parameters
+        for start in range(0, len(user_ids), 500):
+            chunk = user_ids[start:start + 500]
+            rows = self.conn.execute(f'''
+                SELECT j.run_id, j.user_id, j.status, j.attempts, j.digest, j.fetched_at, r.slot,
+                       r.finished_at IS NULL AS run_open, {condition} AS job_open
+                FROM daily_jobs j JOIN daily_runs r ON r.run_id = j.run_id
+                WHERE r.slot >= ? AND j.user_id IN ({', '.join('?' * len(chunk))})
+                ORDER BY r.slot DESC
+            ''', (*params, since, *chunk)).fetchall()
+            for row in rows:
+                if not row['job_open']:
+                    finished.add(row['user_id'])
+                elif row['run_open'] and row['user_id'] not in open_jobs:
+                    job = dict(row)
+                    del job['run_open'], job['job_open']
+                    open_jobs[row['user_id']] = job
+
+        jobs = [open_jobs[user_id] for user_id in user_ids if user_id in open_jobs]
+        missing = [user_id for user_id in user_ids if user_id not in open_jobs and user_id not in finished]
+        return jobs, missing
+
+    def retryable(self, since):
+        """Return ``(slot, user_id, attempts, updated_at)`` for failed jobs that may still be retried.
+
+        Only jobs in unfinished runs with a slot after ``since`` are returned.
+        """
+        rows = self.conn.execute('''
+            SELECT r.slot, j.user_id, j.attempts, j.updated_at
+            FROM daily_jobs j JOIN daily_runs r ON r.run_id = j.run_id
+            WHERE r.finished_at IS NULL AND r.slot >= ? AND j.status = ? AND j.attempts < ?
+            ORDER BY r.slot
+        ''', (since, FAILED, self.max_attempts)).fetchall()
+        return [(row['slot'], row['user_id'], row['attempts'], row['updated_at']) for row in rows]
+
+    def unfinished(self, since):
+        """Return ``(slot, user_id)`` for every open job in unfinished runs with a slot after ``since``."""
+        condition, params = self._open_condition()
+        rows = self.conn.execute(f'''
+            SELECT r.slot, j.user_id
+            FROM daily_jobs j JOIN daily_runs r ON r.run_id = j.run_id
+            WHERE r.finished_at IS NULL AND r.slot >= ? AND {condition}
+            ORDER BY r.slot
+        ''', (since, *params)).fetchall()
+        return [(row['slot'], row['user_id']) for row in rows]
+
+    def _update(self, run_id, user_id, sql, params=()):
+        with self.conn:
+            self.conn.execute(
+                f"UPDATE daily_jobs SET {sql}, updated_at = ? WHERE run_id = ? AND user_id = ?",
+                (*params, time.time(), run_id, str(user_id))
+            )
+
+    def mark_fetched(self, run_id, user_id, digest, content_hash):
+        """Store a job's serialized digest."""
+        self._update(
+            run_id, user_id,
+            "status = ?, digest = ?, content_hash = ?, fetched_at = ?, error = NULL",
+            (FETCHED, digest, content_hash, time.time())
+        )
+
+    def mark_delivered(self, run_id, user_id):
+        """Record that a job's digest was sent."""
+        self._update(run_id, user_id, "status = ?, digest = NULL", (DELIVERED,))
+
+    def mark_skipped(self, run_id, user_id):
+        """Record that a job's user no longer gets a daily reminder."""
+        self._update(run_id, user_id, "status = ?, digest = NULL", (SKIPPED,))
+
+    def mark_failed(self, run_id, user_id, error):
+        """Record a failed attempt at a job."""
+        self._update(run_id, user_id, "status = ?, attempts = attempts + 1, error = ?", (FAILED, str(error)))
+
+    def finish_runs(self, before=None):
+        """Mark runs finished once none of their jobs are open.
+
+        Runs with a slot before ``before`` are finished regardless, abandoning
+        whatever is still open in them.
+
+        Returns:
+            The number of runs marked finished.
+        """
+        condition, params = self._open_condition()
+        now = time.time()
+        with self.conn:
+            finished = self.conn.execute(f'''
+                UPDATE daily_runs SET finished_at = ?
+                WHERE finished_at IS NULL AND NOT EXISTS (
+                    SELECT 1 FROM daily_jobs j WHERE j.run_id = daily_runs.run_id AND {condition}
+                )
+            ''', (now, *params)).rowcount
+            if before is not None:
+                abandoned = self.conn.execute(
+                    "UPDATE daily_runs SET finished_at = ? WHERE finished_at IS NULL AND slot < ?",
+                    (now, before)
+                ).rowcount
+                if abandoned:
+                    logger.warning(f"Abandoned {abandoned} unfinished daily runs that are too old to resume")
+                finished += abandoned
+        return finished
+
+    def prune(self, before):
+        """Delete finished runs with a slot before ``before``, and their jobs."""
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM daily_jobs WHERE run_id IN (SELECT run_id FROM daily_runs WHERE finished_at IS NOT NULL AND slot < ?)",
+                (before,)
+            )
+            self.conn.execute("DELETE FROM daily_runs WHERE finished_at IS NOT NULL AND slot < ?", (before,))
+
+
+class AsyncDailyJobStore:
+    """Awaitable access to a DailyJobStore that runs its queries on the database thread."""
+
+    def __init__(self, store, database):
+        self.store = store
+        self.database = database
+
+    def close(self):
+        """Close the store's database connection."""
+        self.store.close()
+
+    async def create_run(self, slot, user_ids):
+        """Record a new run and return its id."""
+        return await self.database.run(self.store.create_run, slot, list(user_ids))
+
+    async def lookup(self, user_ids, since):
+        """Return the (jobs, missing) split of the given users."""
+        return await self.database.run(self.store.lookup, list(user_ids), since)
+
+    async def retryable(self, since):
+        """Return the failed jobs that may still be retried."""
+        return await self.database.run(self.store.retryable, since)
+
+    async def unfinished(self, since):
+        """Return ``(slot, user_id)`` for every open job in unfinished runs."""
+        return await self.database.run(self.store.unfinished, since)
+
+    async def mark_fetched(self, run_id, user_id, digest, content_hash):
+        """Store a job's serialized digest."""
+        await self.database.run(self.store.mark_fetched, run_id, user_id, digest, content_hash)
+
+    async def mark_delivered(self, run_id, user_id):
+        """Record that a job's digest was sent."""
+        await self.database.run(self.store.mark_delivered, run_id, user_id)
+
+    async def mark_skipped(self, run_id, user_id):
+        """Record that a job's user no longer gets a daily reminder."""
+        await self.database.run(self.store.mark_skipped, run_id, user_id)
+
+    async def mark_failed(self, run_id, user_id, error):
+        """Record a failed attempt at a job."""
+        await self.database.run(self.store.mark_failed, run_id, user_id, error)
+
+    async def finish_runs(self, before=None):
+        """Mark runs finished, abandoning those with a slot before ``before``."""
+        return await self.database.run(self.store.finish_runs, before)
+
+    async def prune(self, before):
+        """Delete finished runs with a slot before ``before``, and their jobs."""
+        await self.database.run(self.store.prune, before)
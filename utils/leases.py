@@ -0,0 +1,178 @@
+"""Lease-based partitioning of users between processes sharing the daily run."""
+import abc
+import hashlib
+import logging
+import math
+import sqlite3
+import time
+
+from utils.config import DAILY_PARTITIONS, DB_BUSY_TIMEOUT_MS, LEASE_TTL_SECONDS
+
+logger = logging.getLogger('canvasbot.leases')
+
+
+def partition_for(user_id, partitions=DAILY_PARTITIONS):
+    """Return the partition a user belongs to."""
+    digest = hashlib.sha256(str(user_id).encode()).digest()
+    return int.from_bytes(digest[:8], "big") % partitions
+
+
+class LeaseStore(abc.ABC):
+    """Shared storage for partition leases and worker heartbeats.
+
+    Implementations must make ``acquire`` atomic across every process using
+    the store. SQLiteLeaseStore is enough for workers on a single host.
+    """
+
+    @abc.abstractmethod
+    def heartbeat(self, worker_id, ttl):
+        """Record that a worker is alive for the next ``ttl`` seconds."""
+
+    @abc.abstractmethod
+    def live_workers(self):
+        """Return the ids of the workers whose heartbeat has not expired."""
+
+    @abc.abstractmethod
+    def acquire(self, partition, worker_id, ttl):
+        """Take or renew a partition's lease if it is free, expired or already ours.
+
+        Returns:
+            Whether the worker now holds the lease.
+        """
+
+    @abc.abstractmethod
+    def release(self, partition, worker_id):
+        """Give up a partition's lease if the worker holds it."""
+
+    @abc.abstractmethod
+    def retire(self, worker_id):
+        """Release every lease of a worker and forget its heartbeat."""
+
+
+class SQLiteLeaseStore(LeaseStore):
+    """Leases kept in the bot's SQLite database."""
+
+    def __init__(self, db_file):
+        # The lease manager refreshes on the database thread, not the thread that opens the store
+        self.conn = sqlite3.connect(db_file, check_same_thread=False, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+        with self.conn:
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS leases (
+                    partition INTEGER PRIMARY KEY,
+                    worker_id TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            ''')
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS workers (
+                    worker_id TEXT PRIMARY KEY,
+                    expires_at REAL NOT NULL
+                )
+            ''')
+
+    def close(self):
+        """Close the database connection."""
+        self.conn.close()
+
+    def heartbeat(self, worker_id, ttl):
+        now = time.time()
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO workers (worker_id, expires_at) VALUES (?, ?) "
+                "ON CONFLICT(worker_id) DO UPDATE SET expires_at = excluded.expires_at",
+                (worker_id, now + ttl)
+            )
+            self.conn.execute("DELETE FROM workers WHERE expires_at < ?", (now,))
+
+    def live_workers(self):
+        rows = self.conn.execute("SELECT worker_id FROM workers WHERE expires_at >= ? ORDER BY worker_id", (time.time(),))
+        return [row[0] for row in rows.fetchall()]
+
+    def acquire(self, partition, worker_id, ttl):
+        now = time.time()
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO leases (partition, worker_id, expires_at) VALUES (?, ?, ?)",
+                (partition, worker_id, now + ttl)
+            )
+            cursor = self.conn.execute(
+                "UPDATE leases SET worker_id = ?, expires_at = ? WHERE partition = ? AND (worker_id = ? OR expires_at < ?)",
+                (worker_id, now + ttl, partition, worker_id, now)
+            )
+        return cursor.rowcount == 1
+
+    def release(self, partition, worker_id):
+        with self.conn:
+            self.conn.execute("DELETE FROM leases WHERE partition = ? AND worker_id = ?", (partition, worker_id))
+
+    def retire(self, worker_id):
+        with self.conn:
+            self.conn.execute("DELETE FROM leases WHERE worker_id = ?", (worker_id,))
+            self.conn.execute("DELETE FROM workers WHERE worker_id = ?", (worker_id,))
+
+
+class LeaseManager:
+    """Keeps this process holding its fair share of the user partitions.
+
+    Every refresh renews the leases already held, gives back partitions above
+    ``ceil(partitions / live workers)`` and picks up free or expired ones, so
+    the partitions of a dead worker are taken over once its leases lapse.
+    Ownership is only trusted until the local copy of the lease expires.
+
+    ``refresh`` queries the store and may run on another thread (such as the
+    database thread); it replaces the owned leases in one assignment, so
+    ``owns`` can be called from the event loop meanwhile.
+    """
+
+    def __init__(self, store, worker_id, partitions=DAILY_PARTITIONS, ttl=LEASE_TTL_SECONDS):
+        self.store = store
+        self.worker_id = worker_id
+        self.partitions = partitions
+        self.ttl = ttl
+        self._owned = {}
+
+    @property
+    def owned(self):
+        """The partitions currently held."""
+        now = time.time()
+        return sorted(partition for partition, expires_at in self._owned.items() if expires_at > now)
+
+    def owns(self, user_id):
+        """Whether this process is responsible for a user."""
+        return self._owned.get(partition_for(user_id, self.partitions), 0) > time.time()
+
+    def refresh(self):
+        """Renew, release and acquire leases to converge on a fair share."""
+        self.store.heartbeat(self.worker_id, self.ttl)
+        share = math.ceil(self.partitions / max(len(self.store.live_workers()), 1))
+        expires_at = time.time() + self.ttl
+        owned = {}
+
+        for partition in list(self._owned):
+            if self.store.acquire(partition, self.worker_id, self.ttl):
+                owned[partition] = expires_at
+            else:
+                logger.warning(f"Lost the lease on partition {partition}")
+
+        # Give back partitions above our share so new workers can take them
+        while len(owned) > share:
+            partition = max(owned)
+            self.store.release(partition, self.worker_id)
+            del owned[partition]
+
+        # Start from a worker-specific point so workers don't all contend for the same partitions
+        start = partition_for(self.worker_id, self.partitions)
+        for step in range(self.partitions):
+            if len(owned) >= share:
+                break
+            partition = (start + step) % self.partitions
+            if partition not in owned and self.store.acquire(partition, self.worker_id, self.ttl):
+                owned[partition] = expires_at
+
+        self._owned = owned
+        return self.owned
+
+    def release_all(self):
+        """Give up every lease, e.g. on shutdown."""
+        self.store.retire(self.worker_id)
+        self._owned = {}
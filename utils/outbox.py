@@ -0,0 +1,159 @@
+"""Central queue for outgoing Discord messages."""
+import asyncio
+import itertools
+import logging
+
+import discord
+
+from utils.config import DISCORD_BATCH_RATE
+from utils.pipeline import Pacer
+
+logger = logging.getLogger('canvasbot.outbox')
+
+# Send priorities, lowest first
+INTERACTIVE = 0
+BATCH = 1
+
+# Discord's limits for a single message
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_EMBED_CHARACTERS = 6000
+
+
+def pack_embeds(embeds):
+    """Group embeds into as few messages as Discord allows, keeping their order.
+
+    Each message holds at most MAX_EMBEDS_PER_MESSAGE embeds totalling at most
+    MAX_EMBED_CHARACTERS characters. Empty embeds are dropped since Discord
+    rejects them.
+
+    Returns:
+        A list of embed lists, one per message.
+    """
+    messages = []
+    current = []
+    characters = 0
+    for embed in embeds:
+        size = len(embed)
+        if size == 0 and not embed.fields:
+            continue
+        if current and (len(current) >= MAX_EMBEDS_PER_MESSAGE or characters + size > MAX_EMBED_CHARACTERS):
+            messages.append(current)
+            current = []
+            characters = 0
+        current.append(embed)
+        characters += size
+    if current:
+        messages.append(current)
+    return messages
+
+
+def route_key(destination):
+    """Return the key of the rate limit route a destination's messages share."""
+    if isinstance(destination, discord.Webhook):
+        # Interaction followups share the application's webhook id but each has its own token
+        return ("webhook", destination.token or destination.id)
+    if isinstance(destination, discord.abc.User):
+        return ("user", destination.id)
+    # Channels, DM channels and partial messageables all share the channel's route
+    return ("channel", getattr(destination, "id", id(destination)))
+
+
+class Outbox:
+    """Queues outgoing messages per destination and packs embeds into as few messages as possible.
+
+    Each destination (a channel, user or interaction followup) has its own
+    priority queue drained by a single sender, so at most one request per
+    per-route bucket is in flight and discord.py's route limiter rarely has to
+    wait. Interactive sends jump ahead of queued daily batch sends, and batch
+    sends are paced across all destinations to stay under the global limit
+    and held back while any interactive send is waiting.
+    """
+
+    def __init__(self, batch_rate=DISCORD_BATCH_RATE):
+        self.batch_pacer = Pacer(batch_rate)
+        self._queues = {}
+        self._senders = {}
+        self._counter = itertools.count()
+        self._interactive_pending = {}
+        self._interactive_changed = asyncio.Condition()
+        self.sent = 0
+
+    async def send(self, destination, embeds=None, content=None, priority=BATCH):
+        """Queue a message and wait until it has been sent.
+
+        Args:
+            destination: Any messageable (user, channel) or interaction followup webhook
+            embeds: Embeds to send, packed into as few messages as possible
+            content: Text sent with the first message
+            priority: INTERACTIVE or BATCH
+
+        Returns:
+            The sent messages.
+
+        Raises:
+            discord.HTTPException: If Discord rejects one of the messages; the rest are not sent.
+        """
+        messages = [{"embeds": batch} for batch in pack_embeds(embeds or [])]
+        if content is not None:
+            if messages:
+                messages[0]["content"] = content
+            else:
+                messages.append({"content": content})
+        if not messages:
+            return []
+
+        key = route_key(destination)
+        future = asyncio.get_running_loop().create_future()
+        if key not in self._queues:
+            self._queues[key] = asyncio.PriorityQueue()
+        self._queues[key].put_nowait((priority, next(self._counter), destination, messages, future))
+        if priority == INTERACTIVE:
+            self._interactive_pending[key] = self._interactive_pending.get(key, 0) + 1
+        if key not in self._senders:
+            self._senders[key] = asyncio.create_task(self._drain(key))
+        return await future
+
+    async def _drain(self, key):
+        """Send a destination's queued messages until its queue is empty."""
+        queue = self._queues[key]
+        try:
+            while not queue.empty():
+                priority, _, destination, messages, future = queue.get_nowait()
+                try:
+                    sent = []
+                    for message in messages:
+                        if priority == BATCH:
+                            await self._yield_to_interactive(key)
+                            await self.batch_pacer.wait()
+                        sent.append(await destination.send(**message))
+                        self.sent += 1
+                    if not future.done():
+                        future.set_result(sent)
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                finally:
+                    if priority == INTERACTIVE:
+                        await self._interactive_done(key)
+        finally:
+            del self._senders[key]
+            if queue.empty():
+                del self._queues[key]
+
+    async def _yield_to_interactive(self, key):
+        """Wait until no other destination has an interactive send waiting.
+
+        Interactive sends for this destination are queued behind the current
+        batch send, so they are not waited for.
+        """
+        async with self._interactive_changed:
+            await self._interactive_changed.wait_for(
+                lambda: sum(self._interactive_pending.values()) == self._interactive_pending.get(key, 0)
+            )
+
+    async def _interactive_done(self, key):
+        async with self._interactive_changed:
+            self._interactive_pending[key] -= 1
+            if not self._interactive_pending[key]:
+                del self._interactive_pending[key]
+            self._interactive_changed.notify_all()
@@ -0,0 +1,177 @@
+"""A small staged, bounded-queue pipeline for batch jobs such as the daily homework run."""
+import asyncio
+import inspect
+import logging
+import time
+
+logger = logging.getLogger('canvasbot.pipeline')
+
+# Marks the end of a stage's input
+_DONE = object()
+
+
+class Pacer:
+    """Spaces out work to a target rate, in items per second, instead of letting it burst."""
+
+    def __init__(self, rate=None):
+        self.rate = rate
+        self._next_start = 0.0
+
+    async def wait(self):
+        """Wait for this item's turn."""
+        if not self.rate:
+            return
+        now = time.monotonic()
+        start = max(now, self._next_start)
+        self._next_start = start + 1 / self.rate
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+class StageStats:
+    """Counters for one pipeline stage."""
+
+    def __init__(self):
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.busy = 0.0
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def elapsed(self):
+        """Seconds between the stage's first item and its last."""
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    @property
+    def throughput(self):
+        """Items handled per second while the stage was running."""
+        elapsed = self.elapsed
+        handled = self.processed + self.dropped + self.failed
+        return handled / elapsed if elapsed > 0 else 0.0
+
+
+class Stage:
+    """One step of a pipeline.
+
+    ``func`` is awaited once per item and returns the item for the next stage,
+    or None to drop it. Each stage has its own worker count and bounded input
+    queue, so a slow stage only backs up its own queue. An optional Pacer
+    limits how fast the stage starts items.
+    """
+
+    def __init__(self, name, func, workers=1, queue_size=100, pacer=None):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.queue_size = queue_size
+        self.pacer = pacer
+        self.stats = StageStats()
+
+
+class Pipeline:
+    """Streams items from a source through a sequence of stages.
+
+    ``describe`` turns an item into a short label for error logs. The optional
+    ``on_failed(stage, item, error)`` and ``on_dropped(stage, item)`` callbacks
+    are called when a stage raises for an item or drops it; coroutine
+    callbacks are awaited.
+    """
+
+    def __init__(self, name, stages, describe=str, on_failed=None, on_dropped=None):
+        self.name = name
+        self.stages = stages
+        self.describe = describe
+        self.on_failed = on_failed
+        self.on_dropped = on_dropped
+
+    async def run(self, source):
+        """Feed every item of ``source`` (an iterable or async iterable) through the stages.
+
+        Returns:
+            The number of items that made it through the last stage.
+        """
+        queues = [asyncio.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        queues.append(None)
+        completed = 0
+
+        async def worker(index):
+            nonlocal completed
+            stage = self.stages[index]
+            inbox, outbox = queues[index], queues[index + 1]
+            while True:
+                item = await inbox.get()
+                if item is _DONE:
+                    return
+
+                if stage.pacer is not None:
+                    await stage.pacer.wait()
+                if stage.stats.started_at is None:
+                    stage.stats.started_at = time.monotonic()
+                started = time.monotonic()
+                try:
+                    result = await stage.func(item)
+                except Exception as e:
+                    stage.stats.failed += 1
+                    logger.error(f"{self.name}: stage '{stage.name}' failed for {self.describe(item)}: {e}")
+                    if self.on_failed is not None:
+                        await self._callback(self.on_failed, stage, item, e)
+                    continue
+                finally:
+                    stage.stats.busy += time.monotonic() - started
+                    stage.stats.finished_at = time.monotonic()
+
+                if result is None:
+                    stage.stats.dropped += 1
+                    if self.on_dropped is not None:
+                        await self._callback(self.on_dropped, stage, item)
+                    continue
+
+                stage.stats.processed += 1
+                if outbox is None:
+                    completed += 1
+                else:
+                    await outbox.put(result)
+
+        async def run_stage(index):
+            # When every worker of a stage is done, close the next stage's input
+            await asyncio.gather(*(worker(index) for _ in range(self.stages[index].workers)))
+            if index + 1 < len(self.stages):
+                for _ in range(self.stages[index + 1].workers):
+                    await queues[index + 1].put(_DONE)
+
+        async def feed():
+            if hasattr(source, "__aiter__"):
+                async for item in source:
+                    await queues[0].put(item)
+            else:
+                for item in source:
+                    await queues[0].put(item)
+            for _ in range(self.stages[0].workers):
+                await queues[0].put(_DONE)
+
+        await asyncio.gather(feed(), *(run_stage(index) for index in range(len(self.stages))))
+        return completed
+
+    async def _callback(self, callback, *args):
+        """Call an on_failed or on_dropped callback, awaiting its result if it is awaitable."""
+        try:
+            result = callback(*args)
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            logger.error(f"{self.name}: {getattr(callback, '__name__', 'callback')} failed: {e}")
+
+    def summary(self):
+        """Describe each stage's counts and throughput."""
+        lines = [f"{self.name} pipeline summary:"]
+        for stage in self.stages:
+            stats = stage.stats
+            lines.append(
+                f"  {stage.name}: {stats.processed} passed, {stats.dropped} skipped, {stats.failed} failed "
+                f"in {stats.elapsed:.1f}s ({stats.throughput:.2f}/s, {stage.workers} workers, {stats.busy:.1f}s busy)"
+            )
+        return "\n".join(lines)
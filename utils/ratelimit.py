@@ -0,0 +1,93 @@
+"""Adaptive per-token pacing for Canvas's leaky-bucket rate limit."""
+import asyncio
+import random
+import time
+
+from utils.config import (
+    CANVAS_RATE_LIMIT_BACKOFF,
+    CANVAS_RATE_LIMIT_BUCKET,
+    CANVAS_RATE_LIMIT_LEAK_RATE,
+    CANVAS_RATE_LIMIT_LOW_WATER,
+)
+
+# Longest single pause before a request, in seconds
+MAX_PACING_DELAY = 30.0
+
+
+class TokenBudget:
+    """The last known rate-limit budget of one Canvas access token."""
+
+    __slots__ = ("remaining", "cost", "updated_at")
+
+    def __init__(self):
+        self.remaining = CANVAS_RATE_LIMIT_BUCKET
+        self.cost = 1.0
+        self.updated_at = time.monotonic()
+
+    def refill(self, now):
+        """Credit the budget with what the bucket has leaked since the last update."""
+        elapsed = now - self.updated_at
+        self.remaining = min(CANVAS_RATE_LIMIT_BUCKET, self.remaining + elapsed * CANVAS_RATE_LIMIT_LEAK_RATE)
+        self.updated_at = now
+
+
+class CanvasRateLimiter:
+    """Tracks each token's remaining Canvas budget and paces requests to stay above a low-water mark.
+
+    Every request deducts the token's last observed cost from the local estimate
+    up front, so concurrent requests are spread out before Canvas starts
+    refusing them. The estimate is corrected from the response headers.
+    """
+
+    def __init__(self, low_water=CANVAS_RATE_LIMIT_LOW_WATER, backoff=CANVAS_RATE_LIMIT_BACKOFF):
+        self.low_water = low_water
+        self.backoff_base = backoff
+        self._budgets = {}
+
+    def _budget(self, token):
+        if token not in self._budgets:
+            self._budgets[token] = TokenBudget()
+        return self._budgets[token]
+
+    def remaining(self, token):
+        """Return the estimated remaining budget of a token."""
+        budget = self._budget(token)
+        budget.refill(time.monotonic())
+        return budget.remaining
+
+    async def acquire(self, token):
+        """Reserve the token's estimated cost, then wait until the budget could spare it.
+
+        The cost is reserved before sleeping, so concurrent callers each wait for
+        the deficit left after their own reservation and are spread out by
+        cost / leak rate instead of all waking together.
+        """
+        budget = self._budget(token)
+        budget.refill(time.monotonic())
+        budget.remaining -= budget.cost
+        deficit = self.low_water - (budget.remaining + budget.cost)
+        if deficit > 0:
+            await asyncio.sleep(min(MAX_PACING_DELAY, deficit / CANVAS_RATE_LIMIT_LEAK_RATE))
+
+    def update(self, token, headers):
+        """Correct a token's budget from Canvas's X-Rate-Limit-Remaining and X-Request-Cost headers."""
+        budget = self._budget(token)
+        try:
+            if "X-Request-Cost" in headers:
+                budget.cost = max(1.0, float(headers["X-Request-Cost"]))
+            if "X-Rate-Limit-Remaining" in headers:
+                budget.remaining = float(headers["X-Rate-Limit-Remaining"])
+                budget.updated_at = time.monotonic()
+        except ValueError:
+            pass
+
+    def throttled(self, token):
+        """Record that Canvas refused a request for this token."""
+        budget = self._budget(token)
+        budget.remaining = 0.0
+        budget.updated_at = time.monotonic()
+
+    def backoff(self, attempt):
+        """Return the delay before retry number ``attempt`` (0-based), with jitter."""
+        delay = self.backoff_base * (2 ** attempt)
+        return min(MAX_PACING_DELAY, delay * random.uniform(0.75, 1.25))
@@ -0,0 +1,367 @@
+"""Local replica of each user's Canvas courses and pending assignments.
+
+A background sync fills the replica from Canvas so /homework can be answered
+with indexed range scans instead of live Canvas requests.
+"""
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+import pytz
+
+from utils.config import DB_BUSY_TIMEOUT_MS, REPLICA_HORIZON_DAYS, REPLICA_MAX_AGE_MINUTES
+from utils.helpers import expects_submission, fetch_homework, get_courses, is_submitted, parse_due_date
+
+
+def replica_key(endpoint, canvas_id):
+    """Return the replica id of a Canvas object; ids are only unique within one Canvas instance."""
+    return f"{urlsplit(endpoint).netloc}:{canvas_id}"
+
+
+def due_timestamp(assignment):
+    """Return an assignment's due date as a UTC timestamp, or None if it is undated."""
+    if not assignment.get('due_at'):
+        return None
+    try:
+        return parse_due_date(assignment['due_at']).timestamp()
+    except (ValueError, TypeError):
+        return None
+
+
+def due_at_text(timestamp):
+    """Turn a stored due timestamp back into the ISO format Canvas uses."""
+    return datetime.fromtimestamp(timestamp, pytz.UTC).isoformat()
+
+
+class ReplicaStore:
+    """Canvas courses and assignments copied into the bot's SQLite database.
+
+    ``user_assignments`` holds the assignments each user can see, with their
+    own due date (NULL when undated) and submission state, indexed by
+    (user_id, due_at). Visibility differs between users of a course (section
+    overrides, unpublished assignments listed to teachers), so nothing is served
+    from another user's sync. ``assignments`` only holds the shared names.
+    """
+
+    def __init__(self, db_file, max_age=REPLICA_MAX_AGE_MINUTES * 60):
+        self.max_age = max_age
+        # Queries run on the database thread through AsyncReplicaStore, not the thread that opens the store
+        self.conn = sqlite3.connect(db_file, check_same_thread=False, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+        self.conn.row_factory = sqlite3.Row
+        with self.conn:
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS courses (
+                    course_id TEXT PRIMARY KEY,
+                    canvas_id TEXT NOT NULL,
+                    name TEXT,
+                    synced_at REAL NOT NULL
+                )
+            ''')
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS assignments (
+                    assignment_id TEXT PRIMARY KEY,
+                    course_id TEXT NOT NULL,
+                    canvas_id TEXT NOT NULL,
+                    name TEXT,
+                    due_at REAL,
+                    synced_at REAL NOT NULL
+                )
+            ''')
+            # Every read goes through user_assignments, so this index only added write cost
+            self.conn.execute("DROP INDEX IF EXISTS assignments_course_due")
+            # The courses each user sees, in the order Canvas lists them
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS user_courses (
+                    user_id TEXT NOT NULL,
+                    course_id TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    PRIMARY KEY (user_id, course_id)
+                )
+            ''')
+            # Replicas from before undated assignments were stored per user are dropped and synced again
+            columns = {row[1]: row[3] for row in self.conn.execute("PRAGMA table_info(user_assignments)")}
+            if columns.get("due_at"):
+                self.conn.execute("DROP TABLE user_assignments")
+                self.conn.execute("DROP TABLE IF EXISTS replica_users")
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS user_assignments (
+                    user_id TEXT NOT NULL,
+                    assignment_id TEXT NOT NULL,
+                    course_id TEXT NOT NULL,
+                    due_at REAL,
+                    pending BOOLEAN NOT NULL DEFAULT 1,
+                    PRIMARY KEY (user_id, assignment_id)
+                )
+            ''')
+            self.conn.execute('''
+                CREATE INDEX IF NOT EXISTS user_assignments_user_due
+                ON user_assignments (user_id, due_at)
+            ''')
+            # When and how each user was last synced; the replica only answers for what was synced
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS replica_users (
+                    user_id TEXT PRIMARY KEY,
+                    endpoint TEXT NOT NULL,
+                    starred BOOLEAN NOT NULL,
+                    synced_at REAL NOT NULL,
+                    horizon REAL NOT NULL
+                )
+            ''')
+
+    def close(self):
+        """Close the database connection."""
+        self.conn.close()
+
+    def _sync_state(self, user_id):
+        return self.conn.execute("SELECT * FROM replica_users WHERE user_id = ?", (str(user_id),)).fetchone()
+
+    def synced_at(self, user_id):
+        """Return when a user was last synced, as a timestamp, or None if never."""
+        state = self._sync_state(user_id)
+        return state["synced_at"] if state else None
+
+    def stale_users(self, user_ids, before):
+        """Return the users in user_ids that were not synced since ``before``, in the given order."""
+        user_ids = [str(user_id) for user_id in user_ids]
+        fresh = set()
+        for start in range(0, len(user_ids), 500):
+            chunk = user_ids[start:start + 500]
+            rows = self.conn.execute(
+                f"SELECT user_id FROM replica_users WHERE synced_at >= ? AND user_id IN ({','.join('?' * len(chunk))})",
+                (before, *chunk)
+            )
+            fresh.update(row[0] for row in rows)
+        return [user_id for user_id in user_ids if user_id not in fresh]
+
+    def courses(self, user_id, endpoint, starred):
+        """Return a user's replicated course list.
+
+        Returns:
+            The list of courses, or None if the user has no replica recent
+            enough or it was synced with other settings.
+        """
+        state = self._sync_state(user_id)
+        if state is None or state["endpoint"] != endpoint or bool(state["starred"]) != bool(starred):
+            return None
+        if time.time() - state["synced_at"] > self.max_age:
+            return None
+
+        rows = self.conn.execute('''
+            SELECT c.canvas_id, c.name FROM user_courses uc
+            JOIN courses c ON c.course_id = uc.course_id
+            WHERE uc.user_id = ?
+            ORDER BY uc.position
+        ''', (str(user_id),))
+        return [{"id": row["canvas_id"], "name": row["name"]} for row in rows]
+
+    def homework(self, user_id, endpoint, course_list, now, cutoff_date, include_overdue=True):
+        """Answer a homework query from the replica.
+
+        Args:
+            user_id: Discord user ID
+            endpoint: Canvas API endpoint the courses belong to
+            course_list: Courses to include, in display order
+            now: Current time separating overdue from upcoming assignments
+            cutoff_date: Latest due date of the upcoming assignments
+            include_overdue: Whether to include overdue assignments
+
+        Returns:
+            A (course_homework, synced_at) tuple in the shape returned by
+            fetch_homework, or None if the replica doesn't cover the query.
+        """
+        state = self._sync_state(user_id)
+        if state is None or state["endpoint"] != endpoint:
+            return None
+        if time.time() - state["synced_at"] > self.max_age or cutoff_date.timestamp() > state["horizon"]:
+            return None
+
+        user_id = str(user_id)
+        entries = {}
+        for course in course_list:
+            entries[replica_key(endpoint, course['id'])] = {"course": course, "overdue": [], "future": [], "undated": []}
+
+        def add(bucket, rows):
+            for row in rows:
+                entry = entries.get(row["course_id"])
+                if entry is not None:
+                    due_at = due_at_text(row["due_at"]) if row["due_at"] is not None else None
+                    entry[bucket].append({"id": row["canvas_id"], "name": row["name"], "due_at": due_at})
+
+        if include_overdue:
+            add("overdue", self.conn.execute('''
+                SELECT ua.course_id, ua.due_at, a.canvas_id, a.name FROM user_assignments ua
+                JOIN assignments a ON a.assignment_id = ua.assignment_id
+                WHERE ua.user_id = ? AND ua.due_at < ? AND ua.pending
+                ORDER BY ua.due_at
+            ''', (user_id, now.timestamp())))
+        add("future", self.conn.execute('''
+            SELECT ua.course_id, ua.due_at, a.canvas_id, a.name FROM user_assignments ua
+            JOIN assignments a ON a.assignment_id = ua.assignment_id
+            WHERE ua.user_id = ? AND ua.due_at >= ? AND ua.due_at <= ?
+            ORDER BY ua.due_at
+        ''', (user_id, now.timestamp(), cutoff_date.timestamp())))
+        add("undated", self.conn.execute('''
+            SELECT ua.course_id, ua.due_at, a.canvas_id, a.name FROM user_assignments ua
+            JOIN assignments a ON a.assignment_id = ua.assignment_id
+            WHERE ua.user_id = ? AND ua.due_at IS NULL
+            ORDER BY a.name
+        ''', (user_id,)))
+
+        course_homework = list(entries.values())
+        if not include_overdue:
+            for entry in course_homework:
+                entry["overdue"] = None
+        return course_homework, state["synced_at"]
+
+    def store(self, user_id, endpoint, starred, course_homework, horizon):
+        """Replace a user's replica with freshly fetched homework.
+
+        Args:
+            user_id: Discord user ID
+            endpoint: Canvas API endpoint the homework was fetched from
+            starred: Whether the course list was limited to starred courses
+            course_homework: Per-course buckets as returned by fetch_homework
+            horizon: Latest due date the fetch covered
+        """
+        user_id = str(user_id)
+        synced_at = time.time()
+        courses = []
+        definitions = []
+        user_assignments = []
+        failed = []
+        for homework in course_homework:
+            course = homework["course"]
+            course_id = replica_key(endpoint, course['id'])
+            courses.append((course_id, str(course['id']), course.get('name', ''), synced_at))
+            if any(homework[bucket] is None for bucket in ("overdue", "future", "undated")):
+                failed.append(course_id)
+            for bucket in ("overdue", "future", "undated"):
+                for assignment in homework[bucket] or []:
+                    assignment_id = replica_key(endpoint, assignment['id'])
+                    due_at = due_timestamp(assignment)
+                    definitions.append((assignment_id, course_id, str(assignment['id']), assignment.get('name', ''), due_at, synced_at))
+                    pending = expects_submission(assignment) and not is_submitted(assignment)
+                    user_assignments.append((user_id, assignment_id, course_id, due_at, pending))
+
+        with self.conn:
+            self.conn.executemany('''
+                INSERT INTO courses (course_id, canvas_id, name, synced_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(course_id) DO UPDATE SET name = excluded.name, synced_at = excluded.synced_at
+            ''', courses)
+            self.conn.executemany('''
+                INSERT INTO assignments (assignment_id, course_id, canvas_id, name, due_at, synced_at) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(assignment_id) DO UPDATE SET
+                    name = excluded.name, due_at = excluded.due_at, synced_at = excluded.synced_at
+            ''', definitions)
+            self.conn.execute("DELETE FROM user_courses WHERE user_id = ?", (user_id,))
+            self.conn.executemany(
+                "INSERT INTO user_courses (user_id, course_id, position) VALUES (?, ?, ?)",
+                [(user_id, course[0], position) for position, course in enumerate(courses)]
+            )
+            # Courses whose fetch failed keep their previous assignments
+            self.conn.execute(
+                f"DELETE FROM user_assignments WHERE user_id = ? AND course_id NOT IN ({','.join('?' * len(failed))})",
+                (user_id, *failed)
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO user_assignments (user_id, assignment_id, course_id, due_at, pending) VALUES (?, ?, ?, ?, ?)",
+                user_assignments
+            )
+            self.conn.execute('''
+                INSERT INTO replica_users (user_id, endpoint, starred, synced_at, horizon) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    endpoint = excluded.endpoint, starred = excluded.starred,
+                    synced_at = excluded.synced_at, horizon = excluded.horizon
+            ''', (user_id, endpoint, bool(starred), synced_at, horizon.timestamp()))
+
+    def prune(self, user_ids=None):
+        """Drop the replicas of users who are gone and assignments no user can see any more.
+
+        Args:
+            user_ids: Every current user; other users' replicas are removed (default: keep all users)
+        """
+        with self.conn:
+            if user_ids is not None:
+                current = {str(user_id) for user_id in user_ids}
+                removed = [
+                    (row[0],) for row in self.conn.execute("SELECT user_id FROM replica_users").fetchall()
+                    if row[0] not in current
+                ]
+                for table in ("replica_users", "user_courses", "user_assignments"):
+                    self.conn.executemany(f"DELETE FROM {table} WHERE user_id = ?", removed)
+            self.conn.execute('''
+                DELETE FROM assignments
+                WHERE assignment_id NOT IN (SELECT assignment_id FROM user_assignments)
+            ''')
+            self.conn.execute("DELETE FROM courses WHERE course_id NOT IN (SELECT course_id FROM user_courses)")
+            self.conn.execute('''
+                DELETE FROM assignments WHERE course_id NOT IN (SELECT course_id FROM user_courses)
+            ''')
+
+
+class AsyncReplicaStore:
+    """Awaitable access to a ReplicaStore that runs its queries on the database thread."""
+
+    def __init__(self, store, database):
+        self.store = store
+        self.database = database
+
+    def close(self):
+        """Close the store's database connection."""
+        self.store.close()
+
+    async def synced_at(self, user_id):
+        """Return when a user was last synced, as a timestamp, or None if never."""
+        return await self.database.run(self.store.synced_at, user_id)
+
+    async def stale_users(self, user_ids, before):
+        """Return the users in user_ids that were not synced since ``before``."""
+        return await self.database.run(self.store.stale_users, list(user_ids), before)
+
+    async def courses(self, user_id, endpoint, starred):
+        """Return a user's replicated course list, or None."""
+        return await self.database.run(self.store.courses, user_id, endpoint, starred)
+
+    async def homework(self, user_id, endpoint, course_list, now, cutoff_date, include_overdue=True):
+        """Answer a homework query from the replica, or return None."""
+        return await self.database.run(self.store.homework, user_id, endpoint, course_list, now, cutoff_date, include_overdue)
+
+    async def store_homework(self, user_id, endpoint, starred, course_homework, horizon):
+        """Replace a user's replica with freshly fetched homework."""
+        await self.database.run(self.store.store, user_id, endpoint, starred, course_homework, horizon)
+
+    async def prune(self, user_ids=None):
+        """Drop the replicas of users who are gone and assignments no user can see any more."""
+        await self.database.run(self.store.prune, None if user_ids is None else list(user_ids))
+
+
+async def sync_user(replica, client, user_id, user_data, catalogue=None):
+    """Fetch a user's courses and assignments from Canvas into the replica.
+
+    Assignments are fetched up to REPLICA_HORIZON_DAYS ahead, which bounds the
+    look-ahead the replica can answer.
+
+    Args:
+        replica: AsyncReplicaStore to fill
+        client: Shared CanvasClient
+        user_id: Discord user ID
+        user_data: The user's database row
+        catalogue: Shared AssignmentCatalogue (default: None)
+
+    Returns:
+        Whether the sync succeeded.
+    """
+    endpoint = user_data.get('endpoint')
+    headers = {"Authorization": f"Bearer {user_data.get('id')}"}
+    starred = user_data.get('starred', False)
+
+    course_list = await get_courses(client, endpoint, headers, starred=starred, user_id=user_id)
+    if course_list is None:
+        return False
+
+    now = datetime.now(pytz.UTC)
+    horizon = now + timedelta(days=REPLICA_HORIZON_DAYS)
+    course_homework = await fetch_homework(client, course_list, headers, endpoint, now=now, cutoff_date=horizon, catalogue=catalogue)
+    await replica.store_homework(user_id, endpoint, starred, course_homework, horizon)
+    return True
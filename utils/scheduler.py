@@ -0,0 +1,165 @@
+"""Per-user daily delivery scheduling in each user's local time."""
+import asyncio
+import datetime
+import hashlib
+import heapq
+import itertools
+
+import pytz
+
+from utils.config import DEFAULT_DELIVERY_TIME, DEFAULT_TIMEZONE, DELIVERY_WINDOW_MINUTES
+
+
+def parse_delivery_time(value):
+    """Parse an "HH:MM" delivery time.
+
+    Raises:
+        ValueError: If the value is not a valid 24-hour time.
+    """
+    hour, minute = value.strip().split(":")
+    return datetime.time(int(hour), int(minute))
+
+
+def delivery_offset(user_id, window_minutes=DELIVERY_WINDOW_MINUTES):
+    """Return a user's stable offset in seconds within a delivery window centred on their delivery time.
+
+    The offset is hashed from the user id, so a user's reminder arrives at about
+    the same minute every day while users as a whole are spread over the window.
+    """
+    window_seconds = window_minutes * 60
+    if window_seconds <= 0:
+        return 0
+    digest = hashlib.sha256(str(user_id).encode()).digest()
+    return int.from_bytes(digest[:8], "big") % window_seconds - window_seconds // 2
+
+
+def next_delivery(timezone, delivery_time, now, offset=0):
+    """Return the next UTC datetime after ``now`` at which ``delivery_time`` occurs in ``timezone``.
+
+    ``offset`` shifts the delivery by that many seconds.
+    """
+    try:
+        tz = pytz.timezone(timezone or DEFAULT_TIMEZONE)
+    except pytz.UnknownTimeZoneError:
+        tz = pytz.timezone(DEFAULT_TIMEZONE)
+    try:
+        local_time = parse_delivery_time(delivery_time or DEFAULT_DELIVERY_TIME)
+    except ValueError:
+        local_time = parse_delivery_time(DEFAULT_DELIVERY_TIME)
+
+    local_date = now.astimezone(tz).date()
+    for days in range(3):
+        candidate = tz.localize(datetime.datetime.combine(local_date + datetime.timedelta(days=days), local_time))
+        candidate = candidate.astimezone(pytz.UTC) + datetime.timedelta(seconds=offset)
+        if candidate > now:
+            return candidate
+    return candidate
+
+
+class DeliveryScheduler:
+    """A min-heap of users keyed by their next delivery time.
+
+    Each user is offset by a stable amount within the delivery window, and
+    ``lead_minutes`` schedules the entries that long before delivery (used to
+    prefetch). Rescheduling a user pushes a new entry and invalidates the old
+    one, so setting changes take effect without rebuilding the heap.
+    """
+
+    def __init__(self, window_minutes=DELIVERY_WINDOW_MINUTES, lead_minutes=0):
+        self.window_minutes = window_minutes
+        self.lead_minutes = lead_minutes
+        self._heap = []
+        self._entries = {}
+        self._settings = {}
+        self._counter = itertools.count()
+        self._changed = asyncio.Event()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, user_id):
+        return str(user_id) in self._entries
+
+    def schedule(self, user_id, timezone=None, delivery_time=None, now=None):
+        """Schedule (or reschedule) a user's next delivery."""
+        user_id = str(user_id)
+        if now is None:
+            now = datetime.datetime.now(pytz.UTC)
+
+        self._settings[user_id] = (timezone, delivery_time)
+        offset = delivery_offset(user_id, self.window_minutes) - self.lead_minutes * 60
+        due = next_delivery(timezone, delivery_time, now, offset)
+        entry = (due.timestamp(), next(self._counter), user_id)
+        self._entries[user_id] = entry
+        heapq.heappush(self._heap, entry)
+        self._changed.set()
+        return due
+
+    def user_ids(self):
+        """Return the ids of every scheduled user."""
+        return list(self._entries)
+
+    def settings(self, user_id):
+        """Return the (timezone, delivery_time) a user is scheduled with, or None."""
+        return self._settings.get(str(user_id))
+
+    def remove(self, user_id):
+        """Stop scheduling a user."""
+        user_id = str(user_id)
+        self._entries.pop(user_id, None)
+        self._settings.pop(user_id, None)
+
+    def next_due(self):
+        """Return the timestamp of the earliest live entry, or None."""
+        while self._heap and self._entries.get(self._heap[0][2]) is not self._heap[0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def count_due_before(self, when, include=None):
+        """Count the users due at or before a UTC datetime, only counting those ``include`` accepts if given."""
+        limit = when.timestamp()
+        return sum(
+            1 for due, _, user_id in self._entries.values()
+            if due <= limit and (include is None or include(user_id))
+        )
+
+    def pop_due(self, now=None):
+        """Remove and return every user due at or before now, rescheduling each for their next day."""
+        if now is None:
+            now = datetime.datetime.now(pytz.UTC)
+
+        due_users = []
+        while True:
+            due = self.next_due()
+            if due is None or due > now.timestamp():
+                break
+            _, _, user_id = heapq.heappop(self._heap)
+            due_users.append(user_id)
+
+        for user_id in due_users:
+            timezone, delivery_time = self._settings[user_id]
+            self.schedule(user_id, timezone, delivery_time, now)
+        return due_users
+
+    async def wait_due(self):
+        """Sleep until at least one user is due and return the due users.
+
+        Wakes early when the schedule changes so an earlier entry is not missed.
+        """
+        while True:
+            self._changed.clear()
+            due = self.next_due()
+            if due is not None:
+                delay = due - datetime.datetime.now(pytz.UTC).timestamp()
+                if delay <= 0:
+                    due_users = self.pop_due()
+                    if due_users:
+                        return due_users
+                    continue
+            else:
+                delay = None
+
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,204 @@
+"""Per-user assignment snapshots used to tell users only what changed since their last reminder."""
+import hashlib
+import sqlite3
+
+from discord import Color, Embed
+
+from utils.config import DB_BUSY_TIMEOUT_MS
+from utils.helpers import MAX_ASSIGNMENTS_PER_FIELD, MAX_FIELD_LENGTH, parse_due_date, truncate_name
+
+
+def fingerprint(assignment):
+    """Return a short hash of the parts of an assignment that users are told about."""
+    content = f"{assignment.get('name')}\x1f{assignment.get('due_at')}"
+    return hashlib.sha1(content.encode()).hexdigest()[:16]
+
+
+def entry_bucket(entry):
+    """Return the bucket a snapshot entry was taken from."""
+    if entry["overdue"]:
+        return "overdue"
+    return "future" if entry["due_at"] else "undated"
+
+
+def take_snapshot(course_homework, previous=None):
+    """Flatten fetched course homework into snapshot entries keyed by assignment id.
+
+    Buckets that failed to fetch (None) are skipped, and the previous snapshot's
+    entries for those buckets are carried forward so a failed fetch isn't
+    reported as the assignments no longer being pending.
+
+    Args:
+        course_homework: Per-course buckets as returned by fetch_homework
+        previous: The user's previous snapshot (default: None)
+
+    Returns:
+        A dict of assignment id to entry.
+    """
+    snapshot = {}
+    failed = set()
+    for homework in course_homework:
+        course = homework["course"]
+        for bucket in ("overdue", "future", "undated"):
+            if homework[bucket] is None:
+                failed.add((str(course["id"]), bucket))
+                continue
+            for assignment in homework[bucket]:
+                assignment_id = str(assignment["id"])
+                snapshot[assignment_id] = {
+                    "assignment_id": assignment_id,
+                    "course_id": str(course["id"]),
+                    "course_name": course.get("name", ""),
+                    "name": assignment.get("name", ""),
+                    "due_at": assignment.get("due_at"),
+                    "fingerprint": fingerprint(assignment),
+                    "overdue": bucket == "overdue",
+                }
+
+    for assignment_id, entry in (previous or {}).items():
+        if assignment_id not in snapshot and (entry["course_id"], entry_bucket(entry)) in failed:
+            snapshot[assignment_id] = entry
+    return snapshot
+
+
+def diff_snapshots(previous, current):
+    """Compare two snapshots.
+
+    Returns:
+        A dict with the "new", "rescheduled", "removed" and "overdue" entries,
+        the last being assignments that became overdue since the previous
+        snapshot. Renames alone are not reported.
+    """
+    changes = {"new": [], "rescheduled": [], "removed": [], "overdue": []}
+    for assignment_id, entry in current.items():
+        old = previous.get(assignment_id)
+        if old is None:
+            changes["new"].append(entry)
+            continue
+        if entry["fingerprint"] != old["fingerprint"] and entry["due_at"] != old["due_at"]:
+            changes["rescheduled"].append(entry)
+        elif entry["overdue"] and not old["overdue"]:
+            changes["overdue"].append(entry)
+    changes["removed"] = [entry for assignment_id, entry in previous.items() if assignment_id not in current]
+    return changes
+
+
+def format_change_field(entries, show_due=True):
+    """Build the embed field text for one kind of change."""
+    lines = []
+    for entry in sorted(entries, key=lambda entry: entry["due_at"] or "~")[:MAX_ASSIGNMENTS_PER_FIELD]:
+        line = f"• **{truncate_name(entry['name'])}** ({truncate_name(entry['course_name'])})"
+        if show_due and entry["due_at"]:
+            try:
+                line += f" - Due: {parse_due_date(entry['due_at']).strftime('%b %d, %Y')}"
+            except (ValueError, TypeError):
+                pass
+        lines.append(line)
+    if len(entries) > MAX_ASSIGNMENTS_PER_FIELD:
+        lines.append(f"…and {len(entries) - MAX_ASSIGNMENTS_PER_FIELD} more")
+    return "\n".join(lines)[:MAX_FIELD_LENGTH]
+
+
+def render_changes(changes):
+    """Render a snapshot diff into one compact embed, or None if nothing changed."""
+    sections = [
+        ("new", "🆕 New", True),
+        ("rescheduled", "📅 Rescheduled", True),
+        ("overdue", "⚠️ Now Overdue", True),
+        ("removed", "✅ No Longer Pending", False),
+    ]
+    if not any(changes[key] for key, _, _ in sections):
+        return None
+
+    embed = Embed(
+        title="Homework Changes",
+        description="Here is what changed since your last daily reminder.",
+        color=Color.blue()
+    )
+    for key, name, show_due in sections:
+        if changes[key]:
+            embed.add_field(name=f"{name} ({len(changes[key])})", value=format_change_field(changes[key], show_due), inline=False)
+    return embed
+
+
+class SnapshotStore:
+    """The assignments each user was last told about, stored in the bot's SQLite database."""
+
+    def __init__(self, db_file):
+        # Queries run on the database thread through AsyncSnapshotStore, not the thread that opens the store
+        self.conn = sqlite3.connect(db_file, check_same_thread=False, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+        self.conn.row_factory = sqlite3.Row
+        with self.conn:
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS assignment_snapshots (
+                    user_id TEXT NOT NULL,
+                    assignment_id TEXT NOT NULL,
+                    course_id TEXT NOT NULL,
+                    course_name TEXT,
+                    name TEXT,
+                    due_at TEXT,
+                    fingerprint TEXT NOT NULL,
+                    overdue BOOLEAN NOT NULL DEFAULT 0,
+                    PRIMARY KEY (user_id, assignment_id)
+                )
+            ''')
+            # Marks users with a snapshot, including ones with no assignments at all
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS snapshot_users (
+                    user_id TEXT PRIMARY KEY,
+                    taken_at TEXT DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+
+    def close(self):
+        """Close the database connection."""
+        self.conn.close()
+
+    def load(self, user_id):
+        """Return a user's snapshot, or None if they have never had one."""
+        if self.conn.execute("SELECT 1 FROM snapshot_users WHERE user_id = ?", (str(user_id),)).fetchone() is None:
+            return None
+        rows = self.conn.execute("SELECT * FROM assignment_snapshots WHERE user_id = ?", (str(user_id),)).fetchall()
+        snapshot = {}
+        for row in rows:
+            entry = dict(row)
+            entry.pop("user_id")
+            entry["overdue"] = bool(entry["overdue"])
+            snapshot[entry["assignment_id"]] = entry
+        return snapshot
+
+    def save(self, user_id, snapshot):
+        """Replace a user's snapshot."""
+        user_id = str(user_id)
+        with self.conn:
+            self.conn.execute("DELETE FROM assignment_snapshots WHERE user_id = ?", (user_id,))
+            self.conn.execute("INSERT OR REPLACE INTO snapshot_users (user_id) VALUES (?)", (user_id,))
+            self.conn.executemany('''
+                INSERT INTO assignment_snapshots
+                (user_id, assignment_id, course_id, course_name, name, due_at, fingerprint, overdue)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [
+                (user_id, entry["assignment_id"], entry["course_id"], entry["course_name"],
+                 entry["name"], entry["due_at"], entry["fingerprint"], entry["overdue"])
+                for entry in snapshot.values()
+            ])
+
+
+class AsyncSnapshotStore:
+    """Awaitable access to a SnapshotStore that runs its queries on the database thread."""
+
+    def __init__(self, store, database):
+        self.store = store
+        self.database = database
+
+    def close(self):
+        """Close the store's database connection."""
+        self.store.close()
+
+    async def load(self, user_id):
+        """Return a user's snapshot, or None if they have never had one."""
+        return await self.database.run(self.store.load, user_id)
+
+    async def save(self, user_id, snapshot):
+        """Replace a user's snapshot."""
+        await self.database.run(self.store.save, user_id, snapshot)
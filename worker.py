@@ -0,0 +1,79 @@
+import os
+import asyncio
+import discord
+from discord.ext import commands
+from dotenv import load_dotenv
+import logging
+
+from utils.db_sqlite import adb, db, DB_FILE
+from utils.canvas import CanvasClient
+from utils.outbox import Outbox
+from utils.replica import AsyncReplicaStore, ReplicaStore
+from utils.config import DAILY_ROLE, HOMEWORK_BACKEND, HTTP_CACHE_PERSIST, WORKER_ID
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('canvasbot')
+
+# Load environment variables
+load_dotenv()
+TOKEN = os.getenv('DISCORD_TOKEN')
+
+class HeadlessWorker(commands.Bot):
+    """A daily-run worker that talks to Discord over REST only, without a gateway connection.
+
+    Run it with DAILY_ROLE=worker next to a bot started with DAILY_ROLE=coordinator;
+    the processes split the users between them through partition leases.
+    """
+
+    def __init__(self):
+        super().__init__(
+            command_prefix=commands.when_mentioned,
+            intents=discord.Intents.none(),
+            application_id=os.getenv('APPLICATION_ID')
+        )
+        self.logger = logger
+        # Shared Canvas HTTP client, reused for the worker's lifetime
+        self.canvas = CanvasClient(cache_file=DB_FILE if HTTP_CACHE_PERSIST else None)
+        # Every outgoing message goes through one queue that packs embeds and orders sends
+        self.outbox = Outbox()
+        # Local copy of Canvas homework, kept up to date by the tasks cog when /homework reads from it
+        self.replica = AsyncReplicaStore(ReplicaStore(DB_FILE), db) if HOMEWORK_BACKEND == "replica" else None
+
+    async def setup_hook(self):
+        """Load only the daily task cog; commands are served by the coordinator."""
+        await self.load_extension("cogs.tasks")
+        logger.info(f"Worker {WORKER_ID} started")
+
+    async def close(self):
+        """Release shared resources once the tasks cog and its runs are shut down."""
+        # Unloading the cog cancels its tasks; closing Canvas first would let them open a new session
+        await super().close()
+        await self.canvas.close()
+        # The replica sync runs in the tasks cog, so the replica is only closed once it has stopped,
+        # and on the database thread behind any query it left queued there
+        if self.replica is not None:
+            await db.run(self.replica.close)
+        # Write the buffered database changes, including any made by the tasks as they stopped
+        await adb.flush()
+
+async def main():
+    """Entry point for a headless daily-run worker."""
+    if DAILY_ROLE != "worker":
+        logger.error("Set DAILY_ROLE=worker to run a headless worker")
+        return
+
+    bot = HeadlessWorker()
+    async with bot:
+        try:
+            # Logging in authenticates the REST client without opening the gateway
+            await bot.login(TOKEN)
+            await asyncio.Event().wait()
+        except discord.LoginFailure:
+            logger.error("Invalid token provided")
+
+if __name__ == "__main__":
+    asyncio.run(main())